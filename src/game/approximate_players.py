@@ -0,0 +1,170 @@
+import os
+import random
+
+import numpy as np
+
+from game.players import Player
+from game.quatro import get_line_masks
+
+models = dict()
+
+
+class LineFeatures:
+
+    def __init__(self, size, num_attributes):
+        self.size = size
+        self.num_attributes = num_attributes
+        self.num_cells = size * size
+        self.lines = np.array([[mask >> cell & 1 for cell in range(self.num_cells)]
+                               for mask in get_line_masks(size)], dtype=np.int64)
+        # per action: lines the returned token would win on and whether there is one, how many lines share an
+        # attribute at each filling level, the share of the other remaining tokens that are unsafe, and a bias
+        self.num_features = 2 + (size - 1) + 2
+
+    def get_token_bits(self, token_ids):
+        return np.array([[token_id >> bit & 1 for bit in range(self.num_attributes)] for token_id in token_ids],
+                        dtype=np.int64).reshape(len(token_ids), self.num_attributes)
+
+    def extract(self, occupied, attribute_boards, given_id, free_cells, returned_ids):
+        # features for every (free cell, returned token) pair at once, plus which cells win on the spot
+        occupancy = np.array([occupied >> cell & 1 for cell in range(self.num_cells)], dtype=np.int64)
+        bits = np.array([[board >> cell & 1 for board in attribute_boards] for cell in range(self.num_cells)],
+                        dtype=np.int64)
+        free_cells = np.asarray(free_cells, dtype=np.int64)
+        num_free = len(free_cells)
+
+        placed = np.repeat(occupancy[np.newaxis], num_free, axis=0)
+        placed[np.arange(num_free), free_cells] = 1
+        placed_bits = np.repeat(bits[np.newaxis], num_free, axis=0)
+        placed_bits[np.arange(num_free), free_cells] = self.get_token_bits([given_id])[0]
+        placed_bits *= placed[:, :, np.newaxis]
+
+        counts = placed @ self.lines.T
+        ones = np.einsum("fck,lc->flk", placed_bits, self.lines)
+        filled = (counts > 0)[:, :, np.newaxis]
+        shared_ones = filled & (ones == counts[:, :, np.newaxis])
+        shared_zeros = filled & (ones == 0)
+        shared = (shared_ones | shared_zeros).any(axis=2)
+        winning = (shared & (counts == self.size)).any(axis=1)
+
+        returned_bits = self.get_token_bits(returned_ids)
+        # lines one token short that a returned token would complete
+        matches = shared_ones.astype(np.int64) @ returned_bits.T + \
+            shared_zeros.astype(np.int64) @ (1 - returned_bits).T
+        threats = ((matches > 0) & (counts == self.size - 1)[:, :, np.newaxis]).sum(axis=1)
+        unsafe = threats > 0
+
+        features = np.zeros((num_free, max(len(returned_ids), 1), self.num_features))
+        features[:, :len(returned_ids), 0] = threats / len(self.lines)
+        features[:, :len(returned_ids), 1] = unsafe
+        for level in range(1, self.size):
+            features[:, :, 1 + level] = ((counts == level) & shared).sum(axis=1)[:, np.newaxis] / len(self.lines)
+        if len(returned_ids) > 1:
+            other_unsafe = unsafe.sum(axis=1)[:, np.newaxis] - unsafe
+            features[:, :, self.size + 1] = other_unsafe / (len(returned_ids) - 1)
+        features[:, :, self.size + 2] = 1.0
+        return features, winning
+
+
+class ValueFunction:
+
+    def __init__(self, num_features, hidden_size=16, seed=None, layers=None):
+        if layers is None:
+            random_state = np.random.RandomState(seed)
+            sizes = [num_features, hidden_size, 1] if hidden_size > 0 else [num_features, 1]
+            layers = [(random_state.normal(scale=1.0 / np.sqrt(sizes[i]), size=(sizes[i], sizes[i + 1])),
+                       np.zeros(sizes[i + 1])) for i in range(len(sizes) - 1)]
+        self.layers = layers
+
+    def predict(self, features):
+        return self._forward(features)[-1][..., 0]
+
+    def update(self, features, targets, learning_rate):
+        # one gradient step on the squared error of the whole batch
+        activations = self._forward(features)
+        delta = (targets - activations[-1][:, 0])[:, np.newaxis] * (1 - activations[-1] ** 2)
+        for i in reversed(range(len(self.layers))):
+            weights, bias = self.layers[i]
+            previous_delta = (delta @ weights.T) * (1 - activations[i] ** 2)
+            self.layers[i] = (weights + learning_rate * activations[i].T @ delta / len(features),
+                              bias + learning_rate * delta.mean(axis=0))
+            delta = previous_delta
+
+    def save(self, path):
+        with open(path, "wb") as model_file:
+            np.savez(model_file, **{"{}_{}".format(kind, i): layer[j] for i, layer in enumerate(self.layers)
+                                    for j, kind in enumerate(("weights", "bias"))})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            num_layers = len(data.files) // 2
+            layers = [(data["weights_{}".format(i)], data["bias_{}".format(i)]) for i in range(num_layers)]
+        return cls(num_features=layers[0][0].shape[0], layers=layers)
+
+    def _forward(self, features):
+        # every layer, the last one included, is squashed so values stay in [-1, 1]
+        activations = [features]
+        for weights, bias in self.layers:
+            activations.append(np.tanh(activations[-1] @ weights + bias))
+        return activations
+
+
+class ApproximatePlayer(Player):
+
+    def __init__(self, name, game_instance=None, **kwargs):
+        super().__init__(name=name, game_instance=game_instance)
+        self.features = LineFeatures(game_instance.size, len(game_instance.dimensions))
+        self.model_path = kwargs.get("model_path")
+        self.learning = kwargs.get("learning", True)
+        # a player that doesn't learn has nothing to gain from exploring
+        self.exploration_probability = kwargs.get("exploration", 0.05 if self.learning else 0.0)
+        self.learning_rate = kwargs.get("learning_rate", 0.05)
+        self.gamma = kwargs.get("gamma", 0.95)
+        if name not in models:
+            if self.model_path is not None and os.path.exists(self.model_path):
+                models[name] = ValueFunction.load(self.model_path)
+            else:
+                models[name] = ValueFunction(self.features.num_features, hidden_size=kwargs.get("hidden_size", 16))
+        self.value_function = models[name]
+        self._returned_token = None
+        self._afterstates = list()
+
+    def choose_token(self, tokens):
+        if self._returned_token is None:
+            return random.choice(list(tokens))
+        return self._returned_token
+
+    def place_token(self, token):
+        game = self.game_instance
+        free_cells = [i * game.size + j for i, j in game.get_free_cells()]
+        given_id = game.get_token_unique_id(token)
+        returned_ids = [game.get_token_unique_id(t) for t in game.remaining_tokens if t != token]
+        occupied, attribute_boards = game.bitboards
+        features, winning = self.features.extract(occupied, attribute_boards, given_id, free_cells, returned_ids)
+
+        if winning.any():
+            cell_index, returned_index = int(np.argmax(winning)), 0
+        elif random.random() < self.exploration_probability:
+            cell_index, returned_index = random.randrange(features.shape[0]), random.randrange(features.shape[1])
+        else:
+            values = self.value_function.predict(features)
+            cell_index, returned_index = np.unravel_index(int(np.argmax(values)), values.shape)
+
+        self._afterstates.append(features[cell_index, returned_index])
+        self._returned_token = None if len(returned_ids) == 0 else \
+            game.get_token_from_unique_id(returned_ids[returned_index])
+        return divmod(free_cells[cell_index], game.size)
+
+    def inform_of_outcome(self, won):
+        if self.learning and len(self._afterstates) > 0:
+            # TD(0) over the afterstates of the game, the last one is worth the outcome
+            afterstates = np.array(self._afterstates)
+            targets = np.empty(len(afterstates))
+            targets[:-1] = self.gamma * self.value_function.predict(afterstates[1:])
+            targets[-1] = won
+            self.value_function.update(afterstates, targets, self.learning_rate)
+            if self.model_path is not None:
+                self.value_function.save(self.model_path)
+        self._afterstates = list()
+        self._returned_token = None
@@ -2,36 +2,51 @@ import itertools
 import random
 
 from game.core_elements import State, Action
-from game.database_utils import StateDBInterface, StateCache, StateEquivalencyCache
+from game.database_utils import StateDBInterface, StateCache, StateEquivalencyCache, get_best_value, \
+    get_item_key
+from game.frozen_policy import get_frozen_policy
+from game.opening_book import get_opening_book
 from game.players import Player
+from game.quatro import QuartoGame
+from game.replay_buffer import get_replay_buffer
+from game.retrograde import get_retrograde_values
+from game.symmetry import decode_state_key
 
 caches = dict()
 
 
+def get_memory_caches(name, database="Quarto"):
+    # the memory and equivalent state caches of a name, shared by everything that reads or learns that memory
+    if name not in caches:
+        caches[name] = (StateCache(database=database, collection="{}-Memory".format(name)),
+                        StateEquivalencyCache(database=database, collection="{}-EquivalentState".format(name)))
+    return caches[name]
+
+
 class Reasoning:
 
     _database = "Quarto"
+    _default_value = 0.0
 
-    def __init__(self, name, dimensions, alpha=0.1, gamma=0.95, exploration=0.05):
-        self._collection = "{}-Memory".format(name)
-        self._transforms_collection = "{}-EquivalentState".format(name)
-        if name not in caches:
-            caches[name] = dict()
-            caches[name][self._collection] = StateCache(database=self._database, collection=self._collection)
-            caches[name][self._transforms_collection] = StateEquivalencyCache(database=self._database,
-                                                                              collection=self._transforms_collection)
-        self._database_interface = caches[name][self._collection]
-        self._equivalency_cache = caches[name][self._transforms_collection]
+    def __init__(self, name, dimensions, alpha=0.1, gamma=0.95, exploration=0.05, size=None, replay_buffer=None,
+                 value_targets=None, learning=True):
+        self._database_interface, self._equivalency_cache = get_memory_caches(name, self._database)
         self.dimensions = dimensions
+        self.size = size if size is not None else len(dimensions)
         self.alpha = alpha
         self.gamma = gamma
         self.exploration_probability = exploration
+        self.replay_buffer = replay_buffer
+        self.value_targets = value_targets
+        # without learning the memory is only read, nothing the games teach is written back
+        self.learning = learning
         self._state_transformation = None
         self._action_route = list()
         self._internal_state = None
+        self._game = None
 
     def get_action(self, game_state, given_token_id):
-        self._internal_state = State(game_state, self.dimensions)
+        self._internal_state = State(game_state, self.dimensions, self.size)
         self._state_transformation = None
         self._internal_state.set_token_as_given(given_token_id)
         # If they're equal, we don't care
@@ -44,57 +59,75 @@ class Reasoning:
         return action if self._state_transformation is None else self._state_transformation.transform_action(action)
 
     def give_reward(self, reward):
+        if not self.learning:
+            self._action_route = list()
+            return
+        if self.replay_buffer is not None:
+            # learning happens offline in a ReplayUpdater
+            self.replay_buffer.extend(self._action_route, reward)
+            return
+        successors = self._database_interface.find_many([next_state for _, _, next_state in self._action_route])
+        updates = list()
         for i in range(len(self._action_route)):
-            current_state = self._action_route[i][0]
-            chosen_action = self._action_route[i][1]
-
-            state_actions = self._database_interface.find_one(self._action_route[i][2])
+            current_state, chosen_action, next_state = self._action_route[i]
 
-            if state_actions is not None:
-                action_values = state_actions["action_mapping"]
-                actions = [Action(encoded_action=key, value=val) for key, val in action_values.items()]
-                best_next_value = max(actions, key=lambda action: action.value).value
-            else:
-                best_next_value = 0
+            best_next_value = get_best_value(next_state, successors.get(next_state.key), self._default_value)
 
             discount_factor = self.gamma ** (len(self._action_route) - i)
+            target = self._get_solved_target(current_state, chosen_action)
+            if target is None:
+                target = reward + discount_factor * best_next_value
             new_value = (1 - self.alpha) * chosen_action.value
-            new_value += self.alpha * (reward + discount_factor * best_next_value)
+            new_value += self.alpha * target
             chosen_action.value = new_value
-            self._update_action_mapping(current_state, chosen_action)
+            updates.append((current_state, chosen_action))
+        self._database_interface.bulk_update(updates)
+
+    def _get_solved_target(self, state, action):
+        # the solved game value of the action, when the position is part of the solve
+        if self.value_targets is None:
+            return None
+        cells, given = decode_state_key(state.key, self.size, len(state.encode()))
+        return self.value_targets.get_action_value(cells, action.token, action.position[0] * self.size +
+                                                   action.position[1], action.returned_token)
 
     def _save_meta_data(self, action):
-        old_state = State(self._internal_state.encode(), self.dimensions)
+        old_state = State(self._internal_state.encode(), self.dimensions, self.size)
         self._internal_state.set_token_position(action.token, action.position)
-        self._action_route.append((old_state, action, State(self._internal_state.encode(), self.dimensions)))
+        self._action_route.append((old_state, action, State(self._internal_state.encode(), self.dimensions, self.size)))
 
-    def _update_action_mapping(self, state, action):
-        self._database_interface.update(state, action)
-
-    def _get_possible_actions(self):
-        remaining = set()
-        free_cells = set((i, j) for i, j in itertools.product(range(len(self.dimensions)),
-                                                              range(len(self.dimensions))))
+    def _get_free_cells_and_remaining(self):
+        remaining = list()
+        free_cells = set((i, j) for i, j in itertools.product(range(self.size), range(self.size)))
         for element in range(len(self._internal_state.encode())):
             if self._internal_state.is_token_placed(element):
-                free_cells.remove(self._internal_state.get_token_id_status(element))
+                free_cells.remove(tuple(self._internal_state.get_token_id_status(element)))
             elif self._internal_state.is_token_remaining(element):
-                remaining.add(element)
+                remaining.append(element)
+        return sorted(free_cells), remaining
 
-        possible_actions = list()
-        chosen_token = self._internal_state.get_chosen_token()
-        for cell in free_cells:
-            for token in remaining:
-                possible_actions.append(Action(chosen_token, list(cell), token))
-        if len(possible_actions) == 0:
-            possible_actions.append(Action(chosen_token, list(free_cells)[0], None))
-        return possible_actions
+    def _get_best_action(self):
+        learned_actions = self._get_learned_actions()
+        best_action = max(learned_actions, key=lambda action: action.value, default=None)
+        if best_action is not None and best_action.value >= self._default_value:
+            return best_action
+        # every action we haven't learned anything about is worth the default, any of them will do
+        unvisited_action = self._get_unvisited_action(learned_actions)
+        return unvisited_action if unvisited_action is not None else best_action
 
-    def _init_state_value_mapping(self, value_mapping):
-        self._database_interface.insert_data(self._internal_state, value_mapping)
+    def _get_unvisited_action(self, learned_actions):
+        learned_keys = set(action.encode() for action in learned_actions)
+        free_cells, remaining = self._get_free_cells_and_remaining()
+        if len(learned_keys) >= len(free_cells) * max(len(remaining), 1):
+            return None
+        while True:
+            action = self._get_random_possible_action(free_cells, remaining)
+            if action.encode() not in learned_keys:
+                return action
 
-    def _get_best_action(self):
-        return max(self._get_action_values(), key=lambda action: action.value)
+    def _get_random_possible_action(self, free_cells, remaining):
+        return Action(self._internal_state.get_chosen_token(), list(random.choice(free_cells)),
+                      random.choice(remaining) if len(remaining) > 0 else None, self._default_value)
 
     def _disambiguate_state(self, state=None):
         state = state if state is not None else self._internal_state
@@ -106,41 +139,102 @@ class Reasoning:
             matched = self._database_interface.find_one_multistate(list(map(lambda x: x[1], equivalent_states)))
 
             if matched is None:
-                self._equivalency_cache.insert_data(state, state, None)
+                if self.learning:
+                    self._equivalency_cache.insert_data(state, state, None)
                 return state, None
             else:
                 for transform, transformed_state in equivalent_states:
-                    if transformed_state.key == matched["state_key"]:
-                        self._equivalency_cache.insert_data(state, transformed_state, transform)
+                    if transformed_state.key == get_item_key(matched):
+                        if self.learning:
+                            self._equivalency_cache.insert_data(state, transformed_state, transform)
                         return transformed_state, transform
         else:
             return equivalent_state, transform
 
     def _get_random_action(self):
-        return random.choice(self._get_action_values())
-
-    def _get_action_values(self):
+        # exploring never misses a win nor hands one over when there's another way
+        game = self._get_internal_game()
+        given_token = game.tokens[self._internal_state.get_chosen_token()]
+        winning_cells, _ = game.get_threat_analysis(given_token)
+        free_cells, remaining = self._get_free_cells_and_remaining()
+        position = random.choice(sorted(winning_cells) if len(winning_cells) > 0 else free_cells)
+        game.place_token(given_token, *position)
+        _, safe_tokens = game.get_threat_analysis()
+        returned = sorted(game.get_token_unique_id(token) for token in safe_tokens) or remaining
+        action = Action(self._internal_state.get_chosen_token(), list(position),
+                        random.choice(returned) if len(returned) > 0 else None, self._default_value)
         state_actions = self._database_interface.find_one(self._internal_state)
+        if state_actions is not None:
+            action.value = state_actions["action_mapping"].get(action.encode(), self._default_value)
+        return action
 
+    def _get_internal_game(self):
+        # the internal state may be a transformed version of the real game, so it gets a game of its own
+        if self._game is None:
+            self._game = QuartoGame(self.dimensions, size=self.size)
+        self._game.state = [self._internal_state.get_token_id_status(token_id)
+                            if self._internal_state.is_token_placed(token_id) else None
+                            for token_id in self._internal_state.get_token_ids()]
+        return self._game
+
+    def _get_learned_actions(self):
+        # only actions that have been updated are stored, everything else implicitly has the default value
+        state_actions = self._database_interface.find_one(self._internal_state)
         if state_actions is None:
-            actions = self._get_possible_actions()
-            self._init_state_value_mapping(actions)
-        else:
-            action_values = state_actions["action_mapping"]
-            actions = [Action(encoded_action=key, value=val) for key, val in action_values.items()]
-        return actions
+            return list()
+        return [Action(encoded_action=key, value=val) for key, val in state_actions["action_mapping"].items()]
 
 
 class ReinforcedPlayer(Player):
 
     def __init__(self, name, game_instance=None, **kwargs):
         super().__init__(name=name, game_instance=game_instance)
-        self.reasoner = Reasoning(name, dimensions=game_instance.dimensions)
+        # a frozen player only reads its compiled policy, it never touches the database nor learns
+        self.frozen_policy = None
+        self.reasoner = None
+        if kwargs.get("frozen_policy") is not None:
+            self.frozen_policy = get_frozen_policy(kwargs["frozen_policy"])
+        else:
+            # several configurations can learn from, or be tested against, the same memory
+            learning = kwargs.get("learning", True)
+            self.reasoner = Reasoning(kwargs.get("memory", name), dimensions=game_instance.dimensions,
+                                      alpha=kwargs.get("alpha", 0.1), gamma=kwargs.get("gamma", 0.95),
+                                      exploration=kwargs.get("exploration", 0.05 if learning else 0.0),
+                                      size=game_instance.size, replay_buffer=self._get_replay_buffer(kwargs),
+                                      value_targets=self._get_value_targets(kwargs.get("retrograde_values")),
+                                      learning=learning)
+        self.opening_book = None
+        if kwargs.get("opening_book") is not None:
+            self.opening_book = get_opening_book(kwargs["opening_book"])
+            if (self.opening_book.size, self.opening_book.num_attributes) != \
+                    (game_instance.size, len(game_instance.dimensions)):
+                raise ValueError("The opening book was built for another game variant")
         self._action = None
 
+    def _get_replay_buffer(self, kwargs):
+        # a path is opened once per process and shared by every player given it
+        replay_buffer = kwargs.get("replay_buffer")
+        if isinstance(replay_buffer, str):
+            replay_buffer = get_replay_buffer(replay_buffer, kwargs.get("replay_capacity", 1000000),
+                                              self.game_instance.dimensions, self.game_instance.size)
+        return replay_buffer
+
+    def _get_value_targets(self, path):
+        if path is None:
+            return None
+        value_targets = get_retrograde_values(path)
+        if (value_targets.size, value_targets.num_attributes) != \
+                (self.game_instance.size, len(self.game_instance.dimensions)):
+            raise ValueError("The retrograde solve was done for another game variant")
+        return value_targets
+
     def place_token(self, token):
-        self._action = self.reasoner.get_action(self.game_instance.state,
-                                                self.game_instance.get_token_unique_id(token))
+        self._action = self._get_book_action(self.game_instance.get_token_unique_id(token))
+        if self._action is None and self.frozen_policy is not None:
+            self._action = self._get_frozen_action(self.game_instance.get_token_unique_id(token))
+        elif self._action is None:
+            self._action = self.reasoner.get_action(self.game_instance.state,
+                                                    self.game_instance.get_token_unique_id(token))
         return self._action.position
 
     def choose_token(self, tokens):
@@ -159,4 +253,41 @@ class ReinforcedPlayer(Player):
             reward = 0.0
         else:
             raise ValueError("Don't do that")
-        self.reasoner.give_reward(reward)
+        if self.reasoner is not None:
+            self.reasoner.give_reward(reward)
+
+    def _get_book_action(self, given_id):
+        if self.opening_book is None:
+            return None
+        move = self.opening_book.get_move(self.game_instance.cell_token_ids, given_id)
+        if move is None:
+            return None
+        cell, returned_id = move
+        return Action(token=given_id, position=divmod(cell, self.game_instance.size), returned_token=returned_id)
+
+    def _get_frozen_action(self, given_id):
+        game = self.game_instance
+        move = self.frozen_policy.get_position_move(game.cell_token_ids, given_id, game.size, len(game.dimensions))
+        if move is not None:
+            cell, returned_id = move
+            return Action(token=given_id, position=divmod(cell, game.size), returned_token=returned_id)
+        # nothing better than the default was learned here, so any move will do as long as it doesn't miss a win
+        # nor hand one over when there's another way
+        token = game.tokens[given_id]
+        winning_cells, _ = game.get_threat_analysis(token)
+        if len(winning_cells) > 0:
+            return Action(token=given_id, position=random.choice(sorted(winning_cells)), returned_token=None)
+        free_cells = game.get_free_cells()
+        random.shuffle(free_cells)
+        fallback = None
+        for position in free_cells:
+            game.place_token(token, *position)
+            _, safe_tokens = game.get_threat_analysis()
+            returned = sorted(game.get_token_unique_id(t) for t in (safe_tokens or game.remaining_tokens))
+            game.remove_token(*position)
+            action = Action(token=given_id, position=position,
+                            returned_token=random.choice(returned) if len(returned) > 0 else None)
+            if len(safe_tokens) > 0 or len(returned) == 0:
+                return action
+            fallback = fallback if fallback is not None else action
+        return fallback
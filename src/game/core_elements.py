@@ -45,14 +45,54 @@ class Action:
 class State:
 
     _given_token_indicator = "Given"
+    # packed key codes, each token takes bits_per_token bits, the first token being the most significant
+    _remaining_code = 0
+    _given_code = 1
+    _cell_offset = 2
 
-    def __init__(self, state, dimensions):
+    def __init__(self, state, dimensions, size=None):
         self._state = [x if x in (None, self._given_token_indicator) else tuple(x) for x in state]
         self.dimensions = dimensions
+        self.size = size if size is not None else len(dimensions)
+        self._key = None
+
+    @classmethod
+    def from_key(cls, key, dimensions, size=None):
+        state = cls([None for i in itertools.product(*dimensions)], dimensions, size)
+        bits_per_token = state.bits_per_token
+        for token_id in reversed(range(len(state._state))):
+            code = key & (1 << bits_per_token) - 1
+            key >>= bits_per_token
+            if code == cls._given_code:
+                state.set_token_as_given(token_id)
+            elif code >= cls._cell_offset:
+                state.set_token_position(token_id, divmod(code - cls._cell_offset, state.size))
+        return state
+
+    @property
+    def bits_per_token(self):
+        return (self.size * self.size + self._cell_offset - 1).bit_length()
+
+    @property
+    def key_size(self):
+        # in bytes, 10 for the classic game
+        return (len(self._state) * self.bits_per_token + 7) // 8
 
     @property
     def key(self):
-        return ",".join(map(str, self._state))
+        if self._key is None:
+            bits_per_token = self.bits_per_token
+            key = 0
+            for status in self._state:
+                if status is None:
+                    code = self._remaining_code
+                elif status == self._given_token_indicator:
+                    code = self._given_code
+                else:
+                    code = self._cell_offset + int(status[0]) * self.size + int(status[1])
+                key = key << bits_per_token | code
+            self._key = key
+        return self._key
 
     def get_token_ids(self):
         for i in range(len(self._state)):
@@ -63,9 +103,11 @@ class State:
 
     def set_token_as_given(self, token_id):
         self._state[token_id] = self._given_token_indicator
+        self._key = None
 
     def set_token_position(self, token_id, position):
-        self._state[token_id] = position
+        self._state[token_id] = tuple(position)
+        self._key = None
 
     def encode(self):
         return list(self._state)
@@ -82,8 +124,14 @@ class State:
     def is_token_remaining(self, token_id):
         return self._state[token_id] is None
 
+    def get_action_count(self):
+        # every free cell with every remaining token to hand over, just the cells once none is left
+        placed = sum(1 for token_id in self.get_token_ids() if self.is_token_placed(token_id))
+        remaining = sum(1 for token_id in self.get_token_ids() if self.is_token_remaining(token_id))
+        return (self.size * self.size - placed) * max(remaining, 1)
+
     def iterate_transformations(self):
-        dim = len(self.dimensions)
+        dim = self.size
         dim_possibilities = [[i for i in range(len(self.dimensions[j]))] for j in range(len(self.dimensions))]
         for permutation in itertools.product(*dim_possibilities):
             for rotation in range(0, 4):
@@ -121,8 +169,8 @@ class StateTransform(ABC):
 class ChainTransform(StateTransform):
 
     def __init__(self, transforms=None, encoded=None):
-        super().__init__(encoded=encoded)
         self.transforms = transforms
+        super().__init__(encoded=encoded)
 
     def decode(self, encoded):
         self.transforms = list()
@@ -132,7 +180,7 @@ class ChainTransform(StateTransform):
 
     def encode(self):
         return [{
-            "transform_type": type(transform),
+            "transform_type": type(transform).__name__,
             "transform_parameters": transform.encode()
         } for transform in self.transforms]
 
@@ -150,9 +198,9 @@ class ChainTransform(StateTransform):
 class RotationTransform(StateTransform):
 
     def __init__(self, number_of_rotations=0, dim=4, encoded=None):
-        super().__init__(encoded=encoded)
         self.dim = dim
         self.number_of_rotations = number_of_rotations
+        super().__init__(encoded=encoded)
 
     def decode(self, encoded):
         self.number_of_rotations, self.dim = encoded.split(",")
@@ -163,19 +211,17 @@ class RotationTransform(StateTransform):
         return "{},{}".format(self.number_of_rotations, self.dim)
 
     def transform_state(self, state):
-        encoded_state = state.encode()
-        state_matrix = [[None for i in range(self.dim)] for j in range(self.dim)]
-        for i in range(len(encoded_state)):
-            row = int(i/self.dim)
-            col = i % self.dim
-            state_matrix[row][col] = i
-        rotated_matrix = np.rot90(m=state_matrix, k=self.number_of_rotations)
-        new_state = [None for i in range(len(encoded_state))]
-        for i in range(len(new_state)):
-            token_position = np.where(rotated_matrix == i)
-            if token_position is len(token_position[0]) == 1:
-                new_state[i] = (token_position[0][0], token_position[1][0])
-        return State(new_state, state.dimensions)
+        # np.rot90 sends (i, j) to (dim - 1 - j, i) on every quarter turn, tokens that aren't placed stay as they are
+        new_state = list()
+        for token_id in state.get_token_ids():
+            position = state.get_token_id_status(token_id)
+            if state.is_token_placed(token_id):
+                i, j = position
+                for rotation in range(self.number_of_rotations % 4):
+                    i, j = self.dim - 1 - j, i
+                position = (i, j)
+            new_state.append(position)
+        return State(new_state, state.dimensions, state.size)
 
     def transform_action(self, action):
         state_matrix = [[0 for i in range(self.dim)] for j in range(self.dim)]
@@ -189,17 +235,17 @@ class RotationTransform(StateTransform):
 class PermutationTransform(StateTransform):
 
     def __init__(self, permutation=None, dimensions=None, encoded=None):
-        super().__init__(encoded=encoded)
         self.dimensions = dimensions
-        self.permutation = tuple(permutation)
+        self.permutation = None if permutation is None else tuple(permutation)
+        super().__init__(encoded=encoded)
 
     def decode(self, encoded):
-        self.dimensions = list(encoded["dimensions"])
+        self.dimensions = [set(d) for d in encoded["dimensions"]]
         self.permutation = tuple(encoded["permutation"])
 
     def encode(self):
         return {
-            "dimensions": self.dimensions,
+            "dimensions": [list(d) for d in self.dimensions],
             "permutation": self.permutation
         }
 
@@ -210,9 +256,8 @@ class PermutationTransform(StateTransform):
         for token_id in state.get_token_ids():
             new_token = self._transform_token(get_token_from_unique_id(token_id, self.dimensions))
             new_token_id = get_token_unique_id(new_token, self.dimensions)
-            new_status = state.get_token_id_status(new_token_id)
-            encoded_state[new_token_id] = new_status
-        return State(encoded_state, self.dimensions)
+            encoded_state[new_token_id] = state.get_token_id_status(token_id)
+        return State(encoded_state, self.dimensions, state.size)
 
     def _transform_token(self, token):
         ordered_dimensions = [list(d) for d in self.dimensions]
@@ -227,8 +272,10 @@ class PermutationTransform(StateTransform):
     def transform_action(self, action):
         token_id = get_token_unique_id(
             self._inverse_transform_token(get_token_from_unique_id(action.token, self.dimensions)), self.dimensions)
-        returned_token_id = get_token_unique_id(self._inverse_transform_token(
-                get_token_from_unique_id(action.returned_token, self.dimensions)),self.dimensions)
+        # nothing is handed over after the last placement
+        returned_token_id = None if action.returned_token is None else get_token_unique_id(
+            self._inverse_transform_token(get_token_from_unique_id(action.returned_token, self.dimensions)),
+            self.dimensions)
         return Action(token=token_id, position=action.position, returned_token=returned_token_id, value=action.value)
 
     def _inverse_transform_token(self, token):
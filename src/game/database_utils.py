@@ -1,9 +1,35 @@
-from pymongo import MongoClient, ReplaceOne
+from pymongo import MongoClient, ReplaceOne, UpdateOne
 
 import game.core_elements
 from game.core_elements import State
 
 
+def get_db_key(state):
+    # the packed key is wider than a BSON integer, fixed width big endian bytes keep it ordered
+    return state.key.to_bytes(state.key_size, "big")
+
+
+def get_item_key(item):
+    return int.from_bytes(item["_id"], "big")
+
+
+def get_best_value(state, item, default_value=0.0):
+    # only learned actions are stored, while a legal action is still unlearned its default value is on offer too
+    learned = item["action_mapping"] if item is not None else dict()
+    best_value = max(learned.values(), default=default_value)
+    if len(learned) < state.get_action_count():
+        best_value = max(best_value, default_value)
+    return best_value
+
+
+def get_action_update(state, action):
+    # the document is created by the first update, so states are only stored once an action has been learned
+    return UpdateOne({"_id": get_db_key(state)}, {
+        "$set": {"action_mapping.{}".format(action.encode()): action.value},
+        "$setOnInsert": {"state": state.encode()}
+    }, upsert=True)
+
+
 class StateDBInterface:
 
     def __init__(self, database, collection=None):
@@ -12,22 +38,29 @@ class StateDBInterface:
         self.db_client = MongoClient()
 
     def find_one(self, state):
-        return self.db_client[self.database][self.collection].find_one({"state_key": state.key})
+        return self.db_client[self.database][self.collection].find_one({"_id": get_db_key(state)})
 
     def find_one_multistate(self, states):
-        keys = [state.key for state in states]
-        return self.db_client[self.database][self.collection].find_one({"state_key": {"$in": keys}})
+        keys = [get_db_key(state) for state in states]
+        return self.db_client[self.database][self.collection].find_one({"_id": {"$in": keys}})
+
+    def find_many(self, states):
+        keys = list(set(get_db_key(state) for state in states))
+        items = self.db_client[self.database][self.collection].find({"_id": {"$in": keys}})
+        return {get_item_key(item): item for item in items}
 
     def insert_data(self, state, value_mapping):
-        item = {"state_key": state.key, "state": state.encode(),
+        item = {"_id": get_db_key(state), "state": state.encode(),
                 "action_mapping": {action.encode(): action.value for action in value_mapping}}
-        self.db_client[self.database][self.collection].replace_one({"state_key": state.key}, item, upsert=True)
+        self.db_client[self.database][self.collection].replace_one({"_id": item["_id"]}, item, upsert=True)
 
     def update(self, state, action):
-        key = state.key
-        self.db_client[self.database][self.collection].update_one({"state_key": key}, {"$set": {
-            "action_mapping.{}".format(action.encode()): action.value
-        }})
+        self.bulk_update([(state, action)])
+
+    def bulk_update(self, state_actions):
+        bulk_ops = [get_action_update(state, action) for state, action in state_actions]
+        if len(bulk_ops) > 0:
+            self.db_client[self.database][self.collection].bulk_write(bulk_ops, ordered=False)
 
 
 class StateCache:
@@ -39,37 +72,55 @@ class StateCache:
         self.db_client = MongoClient()
 
     def find_one(self, state):
+        # states that aren't in the database are remembered as None so they aren't looked up again
         if state.key not in self._storage:
-            item = self.db_client[self.database][self.collection].find_one({"state_key": state.key})
-            if item is not None:
-                self._storage[state.key] = item
-            else:
-                return None
+            self._storage[state.key] = self.db_client[self.database][self.collection].find_one(
+                {"_id": get_db_key(state)})
         return self._storage[state.key]
 
     def find_one_multistate(self, states):
-        keys = [state.key for state in states]
-        for key in keys:
-            if key in self._storage:
-                return self._storage[key]
-        item = self.db_client[self.database][self.collection].find_one({"state_key": {"$in": keys}})
+        for state in states:
+            if self._storage.get(state.key) is not None:
+                return self._storage[state.key]
+        keys = [get_db_key(state) for state in states]
+        item = self.db_client[self.database][self.collection].find_one({"_id": {"$in": keys}})
         if item is not None:
-            self._storage[item.key] = item
+            self._storage[get_item_key(item)] = item
             return item
         else:
             return None
 
     def insert_data(self, state, value_mapping):
-        item = {"state_key": state.key, "state": state.encode(),
+        item = {"_id": get_db_key(state), "state": state.encode(),
                 "action_mapping": {action.encode(): action.value for action in value_mapping}}
-        self.db_client[self.database][self.collection].replace_one({"state_key": state.key}, item, upsert=True)
+        self.db_client[self.database][self.collection].replace_one({"_id": item["_id"]}, item, upsert=True)
         self._storage[state.key] = item
 
+    def find_many(self, states):
+        missing = {state.key: state for state in states if state.key not in self._storage}
+        if len(missing) > 0:
+            for key in missing:
+                self._storage[key] = None
+            keys = [get_db_key(state) for state in missing.values()]
+            for item in self.db_client[self.database][self.collection].find({"_id": {"$in": keys}}):
+                self._storage[get_item_key(item)] = item
+        return {state.key: self._storage[state.key] for state in states if self._storage[state.key] is not None}
+
     def update(self, state, action):
-        self.find_one(state)["action_mapping"][action.encode()] = action.value
-        self.db_client[self.database][self.collection].update_one({"state_key": state.key}, {"$set": {
-            "action_mapping.{}".format(action.encode()): action.value
-        }})
+        self.bulk_update([(state, action)])
+
+    def bulk_update(self, state_actions):
+        bulk_ops = list()
+        for state, action in state_actions:
+            # states that aren't cached will be read back from the database after the write
+            if state.key in self._storage:
+                if self._storage[state.key] is None:
+                    self._storage[state.key] = {"_id": get_db_key(state), "state": state.encode(),
+                                                "action_mapping": dict()}
+                self._storage[state.key]["action_mapping"][action.encode()] = action.value
+            bulk_ops.append(get_action_update(state, action))
+        if len(bulk_ops) > 0:
+            self.db_client[self.database][self.collection].bulk_write(bulk_ops, ordered=False)
 
 
 class StateEquivalencyCache:
@@ -82,12 +133,12 @@ class StateEquivalencyCache:
 
     def find_one(self, state):
         if state.key not in self._storage:
-            item = self.db_client[self.database][self.collection].find_one({"state_key": state.key})
+            item = self.db_client[self.database][self.collection].find_one({"_id": get_db_key(state)})
             if item is not None:
                 self._storage[state.key] = item
             else:
                 return None, None
-        equivalent_state = State(self._storage[state.key]["state"], state.dimensions)
+        equivalent_state = State(self._storage[state.key]["transformed_state"], state.dimensions, state.size)
         transform_type = self._storage[state.key]["transform_type"]
         if transform_type is not None:
             transform_type = getattr(game.core_elements, transform_type)
@@ -98,14 +149,14 @@ class StateEquivalencyCache:
 
     def insert_data(self, state, transformed_state, transform):
         item = {
-            "state_key": state.key,
+            "_id": get_db_key(state),
             "state": state.encode(),
-            "transformed_state_key": transformed_state.key,
+            "transformed_state_key": get_db_key(transformed_state),
             "transformed_state": transformed_state.encode(),
             "transform_parameters": None if transform is None else transform.encode(),
-            "transform_type": None if transform is None else type(transform)
+            "transform_type": None if transform is None else type(transform).__name__
         }
-        self.db_client[self.database][self.collection].replace_one({"state_key": state.key}, item, upsert=True)
+        self.db_client[self.database][self.collection].replace_one({"_id": item["_id"]}, item, upsert=True)
         self._storage[state.key] = item
 
 
@@ -126,7 +177,7 @@ class DatabaseUpdater:
             bulk_ops = dict()
             while len(bulk_ops) < self._batch_size:
                 item = self.queue.get()
-                bulk_ops[item["state_key"]] = ReplaceOne({"state_key": item["state_key"]}, item, upsert=True)
+                bulk_ops[item["_id"]] = ReplaceOne({"_id": item["_id"]}, item, upsert=True)
                 self.queue.task_done()
             db[self.collection].bulk_write(list(bulk_ops.values()))
         db[self.collection].bulk_write(list(bulk_ops.values()))
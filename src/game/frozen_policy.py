@@ -0,0 +1,124 @@
+import argparse
+
+import numpy as np
+from pymongo import MongoClient
+
+from game.core_elements import Action, State
+from game.database_utils import get_item_key
+from game.quatro import get_binary_dimensions
+from game.symmetry import get_canonical_key
+
+
+DATABASE = "Quarto"
+
+_low_mask = (1 << 64) - 1
+_none = 255
+
+policies = dict()
+
+
+def get_frozen_policy(path):
+    if path not in policies:
+        policies[path] = FrozenPolicy.load(path)
+    return policies[path]
+
+
+class FrozenPolicy:
+
+    def __init__(self, table):
+        # rows: high and low 64 bits of the canonical state key, sorted, then the cell to play and the token to hand
+        # over in the canonical frame
+        self._table = table
+        self._high, self._low, self._cells, self._returned = table
+
+    def __len__(self):
+        return self._table.shape[1]
+
+    def get_move(self, key):
+        high, low = np.uint64(key >> 64), np.uint64(key & _low_mask)
+        start = int(np.searchsorted(self._high, high, side="left"))
+        end = int(np.searchsorted(self._high, high, side="right"))
+        index = start + int(np.searchsorted(self._low[start:end], low))
+        if index == end or self._low[index] != low:
+            return None
+        returned_id = int(self._returned[index])
+        return int(self._cells[index]), None if returned_id == _none else returned_id
+
+    def get_position_move(self, cells, given, size, num_attributes):
+        # the move for the position itself, mapped back from the canonical frame
+        key, symmetry = get_canonical_key(cells, given, size, num_attributes)
+        move = self.get_move(key)
+        if move is None:
+            return None
+        cell, returned_id = move
+        return symmetry.inverse_cell(cell), symmetry.inverse_token(returned_id)
+
+    def save(self, path):
+        with open(path, "wb") as policy_file:
+            np.save(policy_file, self._table)
+
+    @classmethod
+    def load(cls, path):
+        # memory mapped and never written to, every process serving it shares the same pages
+        return cls(np.load(path, mmap_mode="r"))
+
+    @classmethod
+    def from_moves(cls, moves):
+        keys = sorted(moves)
+        table = np.empty((4, len(keys)), dtype=np.uint64)
+        table[0] = [key >> 64 for key in keys]
+        table[1] = [key & _low_mask for key in keys]
+        table[2] = [moves[key][0] for key in keys]
+        table[3] = [_none if moves[key][1] is None else moves[key][1] for key in keys]
+        return cls(table)
+
+
+class PolicyCompiler:
+
+    def __init__(self, name, dimensions, size=None, database=DATABASE):
+        self.dimensions = dimensions
+        self.size = size if size is not None else len(dimensions)
+        self.database = database
+        self._collection = "{}-Memory".format(name)
+
+    def compile(self):
+        db = MongoClient()[self.database]
+        best_actions = dict()
+        for item in db[self._collection].find():
+            if len(item["action_mapping"]) == 0:
+                continue
+            encoded_action, value = max(item["action_mapping"].items(), key=lambda x: x[1])
+            # below the default some unlearned action is better, and only the live player can pick one at random
+            if value < 0:
+                continue
+            # keyed by the canonical position, so every symmetric image of a learned state is served the same move
+            state = State.from_key(get_item_key(item), self.dimensions, self.size)
+            cells = [None for i in range(self.size * self.size)]
+            for token_id in state.get_token_ids():
+                if state.is_token_placed(token_id):
+                    i, j = state.get_token_id_status(token_id)
+                    cells[i * self.size + j] = token_id
+            key, symmetry = get_canonical_key(cells, state.get_chosen_token(), self.size, len(self.dimensions))
+            action = Action(encoded_action=encoded_action, value=value)
+            cell = action.position[0] * self.size + action.position[1]
+            if key not in best_actions or best_actions[key][0] < value:
+                best_actions[key] = (value, symmetry.transform_cell(cell),
+                                     symmetry.transform_token(action.returned_token))
+
+        return FrozenPolicy.from_moves({key: (cell, returned_id) for key, (value, cell, returned_id)
+                                        in best_actions.items()})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--name", dest="name", help="Name of the player whose memory is compiled",
+                        required=True)
+    parser.add_argument("-o", "--output", dest="output", help="Frozen policy file", required=True)
+    parser.add_argument("-s", "--size", dest="size", help="Board side length", type=int,
+                        required=False, default=None)
+    parser.add_argument("-k", "--attributes", dest="attributes", help="Number of binary token attributes", type=int,
+                        required=False, default=4)
+    args = parser.parse_args()
+    policy = PolicyCompiler(args.name, get_binary_dimensions(args.attributes), size=args.size).compile()
+    policy.save(args.output)
+    print("Saved {} states to {}".format(len(policy), args.output))
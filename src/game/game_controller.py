@@ -1,25 +1,14 @@
 import argparse
 import os
 
-from game.complex_players import ReinforcedPlayer
-from game.players import HumanTerminalPlayer, RandomPlayer
-from game.quatro import QuartoGame, GameError
+from game.game_records import GameRecordWriter
+from game.player_registry import get_player_type, get_player_type_names
+from game.quatro import QuartoGame, GameError, get_binary_dimensions
 
 
 DATABASE = "Quarto"
 
 
-PLAYER_TYPE_MAP = {
-    "terminal": HumanTerminalPlayer,
-    "random": RandomPlayer,
-    "ai": ReinforcedPlayer
-}
-
-
-def get_player_type(player_type):
-    return PLAYER_TYPE_MAP[player_type]
-
-
 class RunInstance:
 
     DIMENSION_1 = {"white", "black"}
@@ -27,29 +16,37 @@ class RunInstance:
     DIMENSION_3 = {"tall", "short"}
     DIMENSION_4 = {"round", "square"}
 
-    def __init__(self, player1_type, player2_type, verbose=False):
+    def __init__(self, player1_type, player2_type, verbose=False, dimensions=None, size=None, recorder=None):
         self.p1_type = player1_type
         self.p2_type = player2_type
         self.verbose = verbose
+        self.dimensions = dimensions if dimensions is not None else self.get_default_dimensions()
+        self.size = size
+        self.recorder = recorder
+
+    @classmethod
+    def get_default_dimensions(cls):
+        return [cls.DIMENSION_1, cls.DIMENSION_2, cls.DIMENSION_3, cls.DIMENSION_4]
 
     def run(self):
-        dimensions = [self.DIMENSION_1, self.DIMENSION_2, self.DIMENSION_3, self.DIMENSION_4]
-        game_instance = QuartoGame(dimensions=dimensions)
+        game_instance = QuartoGame(dimensions=self.dimensions, size=self.size)
         controller = GameController(game=game_instance,
                                     player1=self.p1_type("Player 1", game_instance=game_instance),
                                     player2=self.p2_type("Player 2", game_instance=game_instance),
-                                    verbose=self.verbose)
+                                    verbose=self.verbose, recorder=self.recorder)
         result = controller.play()
         return result.name if result is not None else "None"
 
 
 class GameController:
 
-    def __init__(self, game, player1, player2, p1_start=True, verbose=False):
+    def __init__(self, game, player1, player2, p1_start=True, verbose=False, recorder=None):
         self.game = game
         self.playing = player1 if p1_start else player2
         self.waiting = player2 if p1_start else player1
         self.verbose = verbose
+        self.recorder = recorder
+        self.moves = list()
 
     def turn(self):
         while True:
@@ -63,6 +60,7 @@ class GameController:
         while True:
             try:
                 self.game.place_token(token, x, y)
+                self.moves.append((x * self.game.size + y, self.game.get_token_unique_id(token)))
                 break
             except GameError as e:
                 msg = "That's not a an acceptable action ({} -> {}, {}), try again.".format(token, x, y)
@@ -81,6 +79,8 @@ class GameController:
             first = True
         else:
             first = False
+        # whoever places first is recorded first
+        players = [self.playing, self.waiting]
         while not self.game.winner and not self.game.tie:
             if self.verbose:
                 self.print_game_board(clear=not first)
@@ -95,6 +95,9 @@ class GameController:
         else:
             self.waiting.inform_of_outcome(0.0)
             self.playing.inform_of_outcome(0.0)
+        if self.recorder is not None:
+            self.recorder.write([player.name for player in players], self.moves,
+                                players.index(self.waiting) if self.game.winner else None)
         return self.waiting if self.game.winner else None
 
     def footer(self, won=True):
@@ -117,9 +120,20 @@ class GameController:
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-p1", "--player1-type", dest="player1", help="Player 1 type",
-                        choices=["terminal", "random", "ai"], required=False, default="ai")
+                        choices=get_player_type_names(), required=False, default="ai")
     parser.add_argument("-p2", "--player2-type", dest="player2", help="Player 2 type",
-                        choices=["terminal", "random", "ai"], required=False, default="ai")
+                        choices=get_player_type_names(), required=False, default="ai")
+    parser.add_argument("-s", "--size", dest="size", help="Board side length", type=int,
+                        required=False, default=None)
+    parser.add_argument("-k", "--attributes", dest="attributes", help="Number of binary token attributes", type=int,
+                        required=False, default=None)
+    parser.add_argument("-o", "--record", dest="record", help="Append the game to this record file",
+                        required=False, default=None)
     args = parser.parse_args()
-    RunInstance(player1_type=PLAYER_TYPE_MAP[args.player1], player2_type=PLAYER_TYPE_MAP[args.player2],
-                verbose=True).run()
+    instance = RunInstance(player1_type=get_player_type(args.player1), player2_type=get_player_type(args.player2),
+                           verbose=True, size=args.size,
+                           dimensions=get_binary_dimensions(args.attributes) if args.attributes is not None else None)
+    if args.record is not None:
+        instance.recorder = GameRecordWriter(args.record, size=args.size or len(instance.dimensions),
+                                             num_attributes=len(instance.dimensions))
+    instance.run()
@@ -0,0 +1,128 @@
+import os
+import struct
+
+
+class GameRecordError(Exception):
+    pass
+
+
+_magic = b"QGR1"
+# magic, board size, number of attributes, advanced rules
+_file_header = struct.Struct("<4sBB?")
+# length of each player name, number of moves, winner (0 first placer, 1 second, 255 tie)
+_game_header = struct.Struct("<BBBB")
+_tie = 255
+
+
+def _is_compact(size, num_attributes):
+    # cell and token both fit in a nibble on the classic board, so a move is a single byte
+    return size * size <= 16 and num_attributes <= 4
+
+
+class GameRecord:
+
+    def __init__(self, player_names, moves, winner):
+        self.player_names = player_names
+        self.moves = moves
+        self.winner = winner
+
+    def replay(self, game):
+        # yields after every placement, moves are (cell, token id)
+        game.reset()
+        for cell, token_id in self.moves:
+            i, j = divmod(cell, game.size)
+            game.place_token(game.tokens[token_id], i, j)
+            yield game, (i, j), token_id
+
+
+class GameRecordWriter:
+
+    def __init__(self, path, size, num_attributes, advanced=False):
+        self.path = path
+        self.size = size
+        self.num_attributes = num_attributes
+        self.advanced = advanced
+        self._compact = _is_compact(size, num_attributes)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            if read_game_header(path) != (size, num_attributes, advanced):
+                raise GameRecordError("{} holds games of another variant".format(path))
+            # a game the last writer didn't finish is dropped, the next one would be read as the rest of it
+            os.truncate(path, _get_complete_size(path, 1 if self._compact else 2))
+            self._file = open(path, "ab")
+        else:
+            self._file = open(path, "ab")
+            self._file.write(_file_header.pack(_magic, size, num_attributes, advanced))
+
+    def write(self, player_names, moves, winner=None):
+        names = [name.encode("utf-8") for name in player_names]
+        if any(len(name) > 255 for name in names):
+            raise GameRecordError("Player names are limited to 255 bytes")
+        record = _game_header.pack(len(names[0]), len(names[1]), len(moves), _tie if winner is None else winner)
+        record += names[0] + names[1]
+        if self._compact:
+            record += bytes(cell << 4 | token_id for cell, token_id in moves)
+        else:
+            record += bytes(x for move in moves for x in move)
+        # a single write, an interrupted one leaves at most this game behind
+        self._file.write(record)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_game_header(path):
+    with open(path, "rb") as record_file:
+        header = record_file.read(_file_header.size)
+    if len(header) < _file_header.size:
+        raise GameRecordError("{} is not a game record file".format(path))
+    magic, size, num_attributes, advanced = _file_header.unpack(header)
+    if magic != _magic:
+        raise GameRecordError("{} is not a game record file".format(path))
+    return size, num_attributes, advanced
+
+
+def _get_complete_size(path, move_size):
+    # the end of the last game that was written whole
+    file_size = os.path.getsize(path)
+    end = _file_header.size
+    with open(path, "rb") as record_file:
+        while True:
+            record_file.seek(end)
+            header = record_file.read(_game_header.size)
+            if len(header) < _game_header.size:
+                return end
+            first_length, second_length, num_moves, winner = _game_header.unpack(header)
+            record_size = _game_header.size + first_length + second_length + num_moves * move_size
+            if end + record_size > file_size:
+                return end
+            end += record_size
+
+
+def iterate_game_records(path):
+    size, num_attributes, advanced = read_game_header(path)
+    move_size = 1 if _is_compact(size, num_attributes) else 2
+    with open(path, "rb") as record_file:
+        record_file.seek(_file_header.size)
+        while True:
+            header = record_file.read(_game_header.size)
+            if len(header) < _game_header.size:
+                # a truncated header means the writer was interrupted mid game
+                return
+            first_length, second_length, num_moves, winner = _game_header.unpack(header)
+            names = record_file.read(first_length + second_length)
+            data = record_file.read(num_moves * move_size)
+            if len(data) < num_moves * move_size:
+                return
+            if move_size == 1:
+                moves = [(x >> 4, x & 0xF) for x in data]
+            else:
+                moves = [(data[i], data[i + 1]) for i in range(0, len(data), 2)]
+            yield GameRecord([names[:first_length].decode("utf-8"), names[first_length:].decode("utf-8")],
+                             moves, None if winner == _tie else winner)
@@ -0,0 +1,67 @@
+import argparse
+
+from pymongo import MongoClient, ReplaceOne
+
+from game.core_elements import State
+from game.database_utils import get_db_key
+from game.quatro import get_binary_dimensions
+
+
+DATABASE = "Quarto"
+
+
+class KeyMigration:
+
+    def __init__(self, database, collection, dimensions, size=None, batch_size=1000):
+        self.database = database
+        self.collection = collection
+        self.dimensions = dimensions
+        self.size = size
+        self.batch_size = batch_size
+
+    def run(self):
+        # rewrites a collection keyed by the old string state_key into one keyed by the packed _id
+        db = MongoClient()[self.database]
+        # the source is left alone until everything has been copied, so an interrupted migration can be rerun
+        target = db["{}-migrating".format(self.collection)]
+        bulk_ops = list()
+        migrated = 0
+        for item in db[self.collection].find():
+            migrated_item = self._migrate_item(item) if "state_key" in item else item
+            bulk_ops.append(ReplaceOne({"_id": migrated_item["_id"]}, migrated_item, upsert=True))
+            if len(bulk_ops) >= self.batch_size:
+                target.bulk_write(bulk_ops, ordered=False)
+                migrated += len(bulk_ops)
+                bulk_ops = list()
+        if len(bulk_ops) > 0:
+            target.bulk_write(bulk_ops, ordered=False)
+            migrated += len(bulk_ops)
+        if migrated > 0:
+            target.rename(self.collection, dropTarget=True)
+        return migrated
+
+    def _migrate_item(self, item):
+        migrated_item = {key: value for key, value in item.items() if key not in ("_id", "state_key")}
+        migrated_item["_id"] = get_db_key(State(item["state"], self.dimensions, self.size))
+        if "transformed_state" in item:
+            migrated_item["transformed_state_key"] = get_db_key(State(item["transformed_state"], self.dimensions,
+                                                                      self.size))
+        if "action_mapping" in item:
+            # unlearned actions are implied, there's no need to keep them around
+            migrated_item["action_mapping"] = {action: value for action, value in item["action_mapping"].items()
+                                               if value != 0}
+        return migrated_item
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--name", dest="name", help="Name of the player whose memory is migrated",
+                        required=True)
+    parser.add_argument("-s", "--size", dest="size", help="Board side length", type=int,
+                        required=False, default=None)
+    parser.add_argument("-k", "--attributes", dest="attributes", help="Number of binary token attributes", type=int,
+                        required=False, default=4)
+    args = parser.parse_args()
+    for collection in ("{}-Memory".format(args.name), "{}-EquivalentState".format(args.name)):
+        count = KeyMigration(DATABASE, collection, get_binary_dimensions(args.attributes), size=args.size).run()
+        print("Migrated {} documents in {}".format(count, collection))
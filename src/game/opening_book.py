@@ -0,0 +1,142 @@
+import argparse
+import struct
+
+from game.quatro import QuartoGame, get_binary_dimensions
+from game.search import NegamaxSearch
+from game.symmetry import canonicalize, decode_position
+
+_none = 255
+
+books = dict()
+
+
+def get_opening_book(path):
+    if path not in books:
+        books[path] = OpeningBook.load(path)
+    return books[path]
+
+
+class OpeningBookError(Exception):
+    pass
+
+
+class OpeningBook:
+
+    _magic = b"QOB2"
+    # magic, board size, number of attributes, number of entries
+    _header = struct.Struct("<4sBBI")
+    # the search value of the move for the player holding the given token, scaled to a signed byte
+    _value = struct.Struct("<b")
+
+    def __init__(self, size, num_attributes, moves=None):
+        self.size = size
+        self.num_attributes = num_attributes
+        # canonical position key -> (cell, token id to hand over, value), the move in the canonical frame
+        self.moves = moves if moves is not None else dict()
+
+    def get_move(self, cells, given):
+        key, symmetry = canonicalize(cells, given, self.size, self.num_attributes)
+        if key not in self.moves:
+            return None
+        cell, returned_id, value = self.moves[key]
+        return (None if cell is None else symmetry.inverse_cell(cell)), symmetry.inverse_token(returned_id)
+
+    def get_value(self, cells, given):
+        key = canonicalize(cells, given, self.size, self.num_attributes)[0]
+        return self.moves[key][2] if key in self.moves else None
+
+    def save(self, path):
+        with open(path, "wb") as book_file:
+            book_file.write(self._header.pack(self._magic, self.size, self.num_attributes, len(self.moves)))
+            for key in sorted(self.moves):
+                cell, returned_id, value = self.moves[key]
+                book_file.write(key + bytes(_none if x is None else x for x in (cell, returned_id)) +
+                                self._value.pack(int(round(value * 127))))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as book_file:
+            magic, size, num_attributes, count = cls._header.unpack(book_file.read(cls._header.size))
+            if magic != cls._magic:
+                raise OpeningBookError("{} is not an opening book of this version".format(path))
+            # every cell, the given token, then the move and its value
+            entry_size = size * size + 1 + 2 + cls._value.size
+            data = book_file.read(entry_size * count)
+        moves = dict()
+        for offset in range(0, len(data), entry_size):
+            entry = data[offset:offset + entry_size]
+            cell, returned_id = (None if x == _none else x for x in entry[-3:-1])
+            moves[entry[:-3]] = (cell, returned_id, cls._value.unpack(entry[-1:])[0] / 127)
+        return cls(size, num_attributes, moves)
+
+
+class OpeningBookBuilder:
+
+    def __init__(self, size=4, num_attributes=4, plies=3, depth=2, verbose=False):
+        self.size = size
+        self.num_attributes = num_attributes
+        self.plies = plies
+        self.verbose = verbose
+        self.game = QuartoGame(dimensions=get_binary_dimensions(num_attributes), size=size)
+        self.search = NegamaxSearch(self.game, depth=depth)
+
+    def build(self):
+        book = OpeningBook(self.size, self.num_attributes)
+        # on an empty board every token is equivalent to every other one, there's nothing to pick the first one by
+        empty_cells = [None for i in range(self.size * self.size)]
+        layer = {canonicalize(empty_cells, 0, self.size, self.num_attributes)[0]}
+        for ply in range(self.plies):
+            next_layer = set()
+            for key in sorted(layer):
+                cells, given = decode_position(key)
+                self._set_position(cells)
+                moves = self.search.get_move_values(given)
+                value, (i, j), returned_id = max(moves, key=lambda x: x[0])
+                # the search can't tell the moves apart, whatever the player does otherwise is as good
+                if value > min(x[0] for x in moves):
+                    book.moves[key] = (i * self.size + j, returned_id, value)
+                if ply + 1 < self.plies:
+                    next_layer.update(self._get_children(cells, given))
+            if self.verbose:
+                print("Ply {}: {} positions, {} in the book, {} nodes searched".format(
+                    ply, len(layer), len(book.moves), self.search.nodes))
+            layer = next_layer
+        return book
+
+    def _set_position(self, cells):
+        self.game.reset()
+        for cell in range(len(cells)):
+            if cells[cell] is not None:
+                self.game.place_token(self.game.tokens[cells[cell]], *divmod(cell, self.size))
+
+    def _get_children(self, cells, given):
+        remaining = set(range(len(self.game.tokens))) - set(cells) - {given}
+        for i, j in self.game.get_free_cells():
+            self.game.place_token(self.game.tokens[given], i, j)
+            finished = self.game.completes_line(i, j) or self.game.tie
+            self.game.remove_token(i, j)
+            if finished:
+                continue
+            child_cells = list(cells)
+            child_cells[i * self.size + j] = given
+            for returned_id in remaining:
+                yield canonicalize(child_cells, returned_id, self.size, self.num_attributes)[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", dest="output", help="Opening book file", required=True)
+    parser.add_argument("-p", "--plies", dest="plies", help="Number of plies covered", type=int,
+                        required=False, default=3)
+    parser.add_argument("-d", "--depth", dest="depth", help="Search depth in moves", type=int,
+                        required=False, default=2)
+    parser.add_argument("-s", "--size", dest="size", help="Board side length", type=int,
+                        required=False, default=4)
+    parser.add_argument("-k", "--attributes", dest="attributes", help="Number of binary token attributes", type=int,
+                        required=False, default=4)
+    args = parser.parse_args()
+    builder = OpeningBookBuilder(size=args.size, num_attributes=args.attributes, plies=args.plies, depth=args.depth,
+                                 verbose=True)
+    opening_book = builder.build()
+    opening_book.save(args.output)
+    print("Saved {} positions to {}".format(len(opening_book.moves), args.output))
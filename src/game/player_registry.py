@@ -0,0 +1,32 @@
+import importlib
+
+
+# player type -> (module, class), modules are only imported once their player type is asked for
+_player_types = {
+    "terminal": ("game.players", "HumanTerminalPlayer"),
+    "random": ("game.players", "RandomPlayer"),
+    "safe": ("game.players", "SafeRandomPlayer"),
+    "ai": ("game.complex_players", "ReinforcedPlayer"),
+    "approx": ("game.approximate_players", "ApproximatePlayer")
+}
+
+player_classes = dict()
+
+
+def register_player_type(player_type, module_name, class_name):
+    _player_types[player_type] = (module_name, class_name)
+    player_classes.pop(player_type, None)
+
+
+def get_player_type_names():
+    return list(_player_types)
+
+
+def get_player_type(player_type):
+    if player_type not in player_classes:
+        if player_type not in _player_types:
+            raise ValueError("Unknown player type {}, expected one of {}".format(player_type,
+                                                                                  get_player_type_names()))
+        module_name, class_name = _player_types[player_type]
+        player_classes[player_type] = getattr(importlib.import_module(module_name), class_name)
+    return player_classes[player_type]
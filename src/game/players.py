@@ -74,11 +74,25 @@ class RandomPlayer(Player):
 
     def place_token(self, token):
         possibilities = list()
-        for i in range(len(self.game_instance.dimensions)):
-            for j in range(len(self.game_instance.dimensions)):
+        for i in range(self.game_instance.size):
+            for j in range(self.game_instance.size):
                 if self.game_instance.board[i][j] is None:
                     possibilities.append((i, j))
         return random.choice(possibilities)
 
     def inform_of_outcome(self, won):
         pass
+
+
+class SafeRandomPlayer(RandomPlayer):
+    # still random, but never misses a win nor hands over one
+
+    def choose_token(self, tokens):
+        _, safe_tokens = self.game_instance.get_threat_analysis()
+        return random.choice(list(safe_tokens & set(tokens) or tokens))
+
+    def place_token(self, token):
+        winning_cells, _ = self.game_instance.get_threat_analysis(token)
+        if len(winning_cells) > 0:
+            return random.choice(list(winning_cells))
+        return super().place_token(token)
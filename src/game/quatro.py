@@ -1,17 +1,71 @@
-
 import itertools
+import random
 
 
 def get_token_unique_id(token, dimensions):
-    ordered_dimensions = [list(d) for d in dimensions]
-    indexed_tokens = list(map(QuartoToken, itertools.product(*ordered_dimensions)))
-    return indexed_tokens.index(token)
+    # mixed radix over the ordered dimensions, the same order itertools.product enumerates them in
+    unique_id = 0
+    for dimension, value in zip(dimensions, token.dimensions):
+        ordered_dimension = list(dimension)
+        unique_id = unique_id * len(ordered_dimension) + ordered_dimension.index(value)
+    return unique_id
 
 
 def get_token_from_unique_id(unique_id, dimensions):
-    ordered_dimensions = [list(d) for d in dimensions]
-    indexed_tokens = list(map(QuartoToken, itertools.product(*ordered_dimensions)))
-    return indexed_tokens[unique_id]
+    values = list()
+    for ordered_dimension in reversed([list(d) for d in dimensions]):
+        unique_id, index = divmod(unique_id, len(ordered_dimension))
+        values.append(ordered_dimension[index])
+    return QuartoToken(reversed(values))
+
+
+def get_binary_dimensions(number_of_attributes):
+    return [{0, 1} for i in range(number_of_attributes)]
+
+
+_line_masks = dict()
+
+
+def get_line_masks(size, advanced=False):
+    # cell (i, j) is bit i * size + j
+    if (size, advanced) not in _line_masks:
+        cells = [[i * size + j for j in range(size)] for i in range(size)]
+        lines = [*cells, *map(list, zip(*cells)),
+                 [cells[i][i] for i in range(size)], [cells[i][size - 1 - i] for i in range(size)]]
+        if advanced:
+            lines.append([cells[i][j] for i, j in itertools.product(*[[0, -1], [0, -1]])])
+            lines.extend(_get_blocks(cells))
+        _line_masks[(size, advanced)] = [sum(1 << cell for cell in line) for line in lines]
+    return _line_masks[(size, advanced)]
+
+
+_cell_line_masks = dict()
+
+
+def get_cell_line_masks(size, advanced=False):
+    if (size, advanced) not in _cell_line_masks:
+        line_masks = get_line_masks(size, advanced)
+        _cell_line_masks[(size, advanced)] = [[mask for mask in line_masks if mask >> cell & 1]
+                                              for cell in range(size * size)]
+    return _cell_line_masks[(size, advanced)]
+
+
+_zobrist_keys = dict()
+
+
+def get_zobrist_keys(size, num_tokens):
+    # a 64 bit key per token and cell it is placed on, then one per token for it being the given one,
+    # seeded so that every process hashes a position the same way
+    if (size, num_tokens) not in _zobrist_keys:
+        random_state = random.Random("zobrist-{}-{}".format(size, num_tokens))
+        placed = [[random_state.getrandbits(64) for cell in range(size * size)] for token_id in range(num_tokens)]
+        given = [random_state.getrandbits(64) for token_id in range(num_tokens)]
+        _zobrist_keys[(size, num_tokens)] = (placed, given)
+    return _zobrist_keys[(size, num_tokens)]
+
+
+def _get_blocks(cells):
+    raise NotImplementedError("I don't know the rules for this")
 
 
 class GameError(Exception):
@@ -20,11 +74,15 @@ class GameError(Exception):
 
 class QuartoGame:
 
-    def __init__(self, dimensions, advanced=False):
+    def __init__(self, dimensions, advanced=False, size=None):
+        if any(len(d) != 2 for d in dimensions):
+            raise GameError("Only binary attributes are supported")
         self.dimensions = dimensions
+        self.size = size if size is not None else len(dimensions)
         self.advanced = advanced
         self.remaining_tokens = set()
         self._finished = None
+        self._symmetric_hashes = None
         self.reset()
 
     @property
@@ -39,34 +97,50 @@ class QuartoGame:
 
     @property
     def tie(self):
-        return len(self.remaining_tokens) == 0
+        return len(self.remaining_tokens) == 0 or self._occupied == (1 << self.size * self.size) - 1
+
+    @property
+    def bitboards(self):
+        # occupied cells, then one plane per token id bit holding the cells whose token has that bit set
+        return self._occupied, tuple(self._attribute_boards)
+
+    @property
+    def cell_token_ids(self):
+        # row major, None for the free cells
+        return [None if token is None else self._token_ids[token] for row in self.board for token in row]
 
     @property
     def state(self):
         # we don't care of the order of the sets as long as it is deterministic
-        ordered_dimensions = [list(d) for d in self.dimensions]
-        indexed_tokens = list(map(QuartoToken, itertools.product(*ordered_dimensions)))
-        inversed_indexed_tokens = {indexed_tokens[i]: i for i in range(len(indexed_tokens))}
-        state = [None for i in indexed_tokens]
-        for i in range(len(self.board)):
-            for j in range(len(self.board[i])):
-                if self.board[i][j] is not None:
-                    state[inversed_indexed_tokens[self.board[i][j]]] = (i, j)
+        state = [None for i in self.tokens]
+        for i, j in itertools.product(range(self.size), repeat=2):
+            if self.board[i][j] is not None:
+                state[self._token_ids[self.board[i][j]]] = (i, j)
         return state
 
     @state.setter
     def state(self, state):
         self.reset()
-        ordered_dimensions = [list(d) for d in self.dimensions]
-        indexed_tokens = list(map(QuartoToken, itertools.product(*ordered_dimensions)))
         for i in filter(lambda idx: state[idx] is not None, range(len(state))):
-            self.place_token(indexed_tokens[i], state[i][0], state[i][1])
+            self.place_token(self.tokens[i], state[i][0], state[i][1])
+
+    def get_zobrist_hash(self, given_id=None, canonical=False):
+        # kept up to date on every placement, canonical hashes are the same for every symmetric position
+        if canonical:
+            if self._symmetric_hashes is None:
+                from game.zobrist import SymmetricZobristHashes
+                self._symmetric_hashes = SymmetricZobristHashes(self.size, len(self.dimensions))
+                for cell, token_id in enumerate(self.cell_token_ids):
+                    if token_id is not None:
+                        self._symmetric_hashes.toggle(token_id, cell)
+            return self._symmetric_hashes.get_canonical_hash(given_id)
+        return self._hash if given_id is None else self._hash ^ self._zobrist_given[given_id]
 
     def get_token_unique_id(self, token):
-        return get_token_unique_id(token, self.dimensions)
+        return self._token_ids[token]
 
     def get_token_from_unique_id(self, unique_id):
-        return get_token_from_unique_id(unique_id, self.dimensions)
+        return self.tokens[unique_id]
 
     def reset(self):
         self._finished = None
@@ -77,11 +151,86 @@ class QuartoGame:
     def place_token(self, token, i, j):
         if token not in self.remaining_tokens:
             raise GameError("That token has already been placed")
+        if not 0 <= i < self.size or not 0 <= j < self.size:
+            raise GameError("That spot is not on the board")
         if self.board[i][j] is not None:
             raise GameError("There is already a token on that spot")
         self.board[i][j] = token
         self.remaining_tokens.remove(token)
+        cell = 1 << i * self.size + j
+        token_id = self._token_ids[token]
+        self._occupied |= cell
+        for bit in range(len(self._attribute_boards)):
+            if token_id >> bit & 1:
+                self._attribute_boards[bit] |= cell
+        self._hash ^= self._zobrist_placed[token_id][i * self.size + j]
+        if self._symmetric_hashes is not None:
+            self._symmetric_hashes.toggle(token_id, i * self.size + j)
+        self._finished = None
+
+    def remove_token(self, i, j):
+        token = self.board[i][j]
+        if token is None:
+            raise GameError("There is no token on that spot")
+        self.board[i][j] = None
+        self.remaining_tokens.add(token)
+        cell = 1 << i * self.size + j
+        self._occupied &= ~cell
+        for bit in range(len(self._attribute_boards)):
+            self._attribute_boards[bit] &= ~cell
+        self._hash ^= self._zobrist_placed[self._token_ids[token]][i * self.size + j]
+        if self._symmetric_hashes is not None:
+            self._symmetric_hashes.toggle(self._token_ids[token], i * self.size + j)
         self._finished = None
+        return token
+
+    def completes_line(self, i, j):
+        # only the lines through the last placed token can have been completed by it
+        for mask in get_cell_line_masks(self.size, self.advanced)[i * self.size + j]:
+            if self._occupied & mask == mask and self._is_similar(mask):
+                return True
+        return False
+
+    def get_line_threats(self):
+        # lines missing a single token: (free cell, attribute bits all of its tokens have, bits none of them has)
+        threats = list()
+        for mask in get_line_masks(self.size, self.advanced):
+            free = mask & ~self._occupied
+            if free == 0 or free & (free - 1) != 0:
+                continue
+            ones, zeros = 0, 0
+            for bit, attribute_board in enumerate(self._attribute_boards):
+                if attribute_board & mask == mask ^ free:
+                    ones |= 1 << bit
+                elif attribute_board & mask == 0:
+                    zeros |= 1 << bit
+            if ones | zeros != 0:
+                threats.append((free.bit_length() - 1, ones, zeros))
+        return threats
+
+    def count_open_lines(self, missing=2):
+        # lines missing exactly that many tokens whose placed tokens still share an attribute, the threats to come
+        count = 0
+        for mask in get_line_masks(self.size, self.advanced):
+            placed = mask & self._occupied
+            if bin(mask ^ placed).count("1") != missing:
+                continue
+            if any((attribute_board & mask) in (0, placed) for attribute_board in self._attribute_boards):
+                count += 1
+        return count
+
+    def get_threat_analysis(self, token=None):
+        # the cells where token wins right away, and the other remaining tokens that can't win anywhere right now
+        winning_cells, unsafe_ids = set(), set()
+        token_ids = [self._token_ids[t] for t in self.remaining_tokens if t != token]
+        for cell, ones, zeros in self.get_line_threats():
+            if token is not None and (self._token_ids[token] & ones or ~self._token_ids[token] & zeros):
+                winning_cells.add(divmod(cell, self.size))
+            unsafe_ids.update(token_id for token_id in token_ids if token_id & ones or ~token_id & zeros)
+        return winning_cells, {self.tokens[token_id] for token_id in token_ids if token_id not in unsafe_ids}
+
+    def get_free_cells(self):
+        return [divmod(cell, self.size) for cell in range(self.size * self.size) if not self._occupied >> cell & 1]
 
     def __str__(self):
         lines = ["| {} |".format(" | ".join(
@@ -93,77 +242,88 @@ class QuartoGame:
         return str(self)
 
     def _build_board(self):
-        self.board = [[None for i in range(len(self.dimensions))] for i in range(len(self.dimensions))]
+        self.board = [[None for i in range(self.size)] for i in range(self.size)]
+        self._occupied = 0
+        self._attribute_boards = [0 for i in self.dimensions]
+        self._zobrist_placed, self._zobrist_given = get_zobrist_keys(self.size, 1 << len(self.dimensions))
+        self._hash = 0
+        if self._symmetric_hashes is not None:
+            self._symmetric_hashes.reset()
 
     def _extract_tokens(self):
         self.tokens = list(map(QuartoToken, itertools.product(*self.dimensions)))
+        self._token_ids = {self.tokens[i]: i for i in range(len(self.tokens))}
+        for i, token in enumerate(self.tokens):
+            token.set_attribute_mask(i)
 
     def _get_finished(self):
         completed = list()
-        for structure in self._get_structures():
-            # get the first not None
-            non_nones = list(filter(None, structure))
-            if len(non_nones) > 0:
-                similarities = non_nones[0].get_similarities(non_nones)
-                if len(non_nones) == len(structure) and any(x is not None for x in similarities):
-                    completed.append(structure)
+        for mask in get_line_masks(self.size, self.advanced):
+            if self._occupied & mask == mask and self._is_similar(mask):
+                completed.append(self._get_structure(mask))
         return completed
 
-    def _get_structures(self):
-        if self.advanced:
-            return [*self._get_rows(), *self._get_columns(), *self._get_diagonals(), self._get_corners(),
-                    *self._get_blocks()]
-        else:
-            return [*self._get_rows(), *self._get_columns(), *self._get_diagonals()]
-
-    def _get_corners(self):
-        return [self.board[i][j] for i, j in itertools.product(*[[0, -1], [0, -1]])]
+    def _is_similar(self, mask):
+        # a full line shares an attribute when every cell has the bit set, or none of them does
+        return any((attribute_board & mask) in (0, mask) for attribute_board in self._attribute_boards)
 
-    def _get_diagonals(self):
-        diagonal1 = list()
-        diagonal2 = list()
-        for i in range(len(self.dimensions)):
-            diagonal1.append(self.board[i][i])
-            diagonal2.append(self.board[i][3-i])
-        return [diagonal1, diagonal2]
-
-    def _get_rows(self):
-        return [self._get_row(i) for i in range(len(self.dimensions))]
-
-    def _get_row(self, i):
-        return self.board[i]
-
-    def _get_columns(self):
-        return [self._get_column(i) for i in range(len(self.dimensions))]
-
-    def _get_column(self, i):
-        return [self.board[j][i] for j in range(len(self.dimensions))]
-
-    def _get_blocks(self):
-        raise NotImplementedError("I don't know the rules for this")
+    def _get_structure(self, mask):
+        return [self.board[cell // self.size][cell % self.size]
+                for cell in range(self.size * self.size) if mask >> cell & 1]
 
 
 class QuartoToken:
-
-    def __init__(self, set_dimensions):
-        self.dimensions = list(set_dimensions)
+    # interned, there's a single instance per combination of attribute values
+    __slots__ = ("dimensions", "attribute_mask", "_id")
+
+    _tokens = dict()
+
+    def __new__(cls, set_dimensions):
+        dimensions = tuple(set_dimensions)
+        if dimensions not in cls._tokens:
+            token = super().__new__(cls)
+            token.dimensions = dimensions
+            # set by the games the token is part of, until then similarities compare the values
+            token.attribute_mask = None
+            token._id = len(cls._tokens)
+            cls._tokens[dimensions] = token
+        return cls._tokens[dimensions]
+
+    def __reduce__(self):
+        # ids are per process, another process interns the values again
+        return QuartoToken, (self.dimensions,)
+
+    def set_attribute_mask(self, token_id):
+        # bit len - 1 - i holds the value of attribute i on binary dimensions, which is the owning game's token id.
+        # Games ordering the values of a shared token differently can't agree on one, it stays on comparing values
+        if self.attribute_mask is None:
+            self.attribute_mask = token_id
+        elif self.attribute_mask != token_id:
+            self.attribute_mask = -1
 
     def get_similarities(self, others):
         if not isinstance(others, set) and not isinstance(others, list) and not isinstance(others, tuple):
             others = [others]
 
-        sim_set = self.unique_dimensions
+        if any(token.attribute_mask is None or token.attribute_mask < 0 for token in [self, *others]):
+            return [value if all(other.dimensions[i] == value for other in others) else None
+                    for i, value in enumerate(self.dimensions)]
+
+        full_mask = (1 << len(self.dimensions)) - 1
+        ones, zeros = self.attribute_mask, full_mask & ~self.attribute_mask
         for other in others:
-            sim_set = sim_set.intersection(other.unique_dimensions)
-        temp_vals = {idx: val for idx, val in sim_set}
-        return [None if i not in temp_vals else temp_vals[i] for i in range(len(self.dimensions))]
+            ones &= other.attribute_mask
+            zeros &= ~other.attribute_mask
+        shared = ones | zeros
+        return [self.dimensions[i] if shared >> len(self.dimensions) - 1 - i & 1 else None
+                for i in range(len(self.dimensions))]
 
     @property
     def unique_dimensions(self):
         return set((i, self.dimensions[i]) for i in range(len(self.dimensions)))
 
     def __str__(self):
-        return "".join([x[0] for x in self.dimensions])
+        return "".join([str(x)[0] for x in self.dimensions])
 
     def __repr__(self):
         return str(self)
@@ -173,7 +333,7 @@ class QuartoToken:
         return set(self.dimensions).intersection(set(other.dimensions))
 
     def __hash__(self):
-        return "".join(x for x in self.dimensions).__hash__()
+        return self._id
 
     def __eq__(self, other):
-        return self.unique_dimensions == other.unique_dimensions
+        return isinstance(other, QuartoToken) and self._id == other._id
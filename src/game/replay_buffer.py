@@ -0,0 +1,167 @@
+import os
+import struct
+
+import numpy as np
+
+from game.core_elements import State, Action
+from game.database_utils import get_best_value
+
+
+buffers = dict()
+
+
+def get_replay_buffer(path, capacity, dimensions, size=None):
+    # every player of a process appends to the same ring, and flushes the same cursor
+    if path not in buffers:
+        buffers[path] = ReplayBuffer(capacity, dimensions, size=size, path=path)
+    return buffers[path]
+
+
+class ReplayBufferError(Exception):
+    pass
+
+
+class ReplayBuffer:
+
+    # per token status: remaining, given, or 2 + the index of the cell it was placed on
+    _remaining = 0
+    _given = 1
+    _cell_offset = 2
+
+    _magic = b"QRB2"
+    # magic, capacity, number of tokens, board size, bytes per token status
+    _header = struct.Struct("<4sQIHB")
+    # the (position, count) cursor follows the header, then the ring
+    _cursor_dtype = np.dtype((np.int64, (2,)))
+
+    def __init__(self, capacity, dimensions, size=None, path=None):
+        self.capacity = capacity
+        self.dimensions = dimensions
+        self.size = size if size is not None else len(dimensions)
+        num_tokens = int(np.prod([len(d) for d in dimensions]))
+        # a byte holds the status of a token up to 15x15 boards
+        self._status_dtype = np.dtype(np.uint8 if self.size * self.size + self._cell_offset <= 256 else np.uint16)
+        dtype = np.dtype([("state", self._status_dtype, (num_tokens,)),
+                          ("next_state", self._status_dtype, (num_tokens,)),
+                          ("action", np.int16, (3,)),
+                          ("reward", np.float32),
+                          ("steps_to_end", np.uint16)])
+        if path is None:
+            self._transitions = np.zeros(capacity, dtype=dtype)
+            self._cursor = np.zeros(2, dtype=np.int64)
+        else:
+            # the cursor is in the same file as the ring, a restarted job can't find one without the other
+            header = self._header.pack(self._magic, capacity, num_tokens, self.size, self._status_dtype.itemsize)
+            if os.path.exists(path):
+                self._check_header(path, header)
+            else:
+                with open(path, "wb") as buffer_file:
+                    buffer_file.write(header + bytes(self._cursor_dtype.itemsize))
+            self._cursor = np.memmap(path, dtype=np.int64, mode="r+", offset=self._header.size, shape=(2,))
+            self._transitions = np.memmap(path, dtype=dtype, mode="r+",
+                                          offset=self._header.size + self._cursor_dtype.itemsize, shape=(capacity,))
+
+    def _check_header(self, path, header):
+        with open(path, "rb") as buffer_file:
+            found = buffer_file.read(self._header.size + self._cursor_dtype.itemsize)
+        if len(found) != self._header.size + self._cursor_dtype.itemsize or found[:len(self._magic)] != self._magic:
+            raise ReplayBufferError("{} is not a replay buffer of this version".format(path))
+        if found[:self._header.size] != header:
+            magic, capacity, num_tokens, size, status_size = self._header.unpack(found[:self._header.size])
+            raise ReplayBufferError("{} holds {} transitions of {} tokens on a {}x{} board".format(
+                path, capacity, num_tokens, size, size))
+
+    def __len__(self):
+        return int(self._cursor[1])
+
+    def append(self, state, action, next_state, reward, steps_to_end):
+        position = int(self._cursor[0])
+        transition = self._transitions[position]
+        transition["state"] = self.encode_state(state)
+        transition["next_state"] = self.encode_state(next_state)
+        transition["action"] = self.encode_action(action)
+        transition["reward"] = reward
+        transition["steps_to_end"] = steps_to_end
+        self._cursor[0] = (position + 1) % self.capacity
+        self._cursor[1] = min(self._cursor[1] + 1, self.capacity)
+
+    def extend(self, action_route, reward):
+        for i in range(len(action_route)):
+            state, action, next_state = action_route[i]
+            self.append(state, action, next_state, reward, len(action_route) - i)
+
+    def sample(self, batch_size):
+        if len(self) == 0:
+            raise ValueError("Can't sample from an empty buffer")
+        return self._transitions[np.random.randint(0, len(self), size=batch_size)]
+
+    def flush(self):
+        if isinstance(self._transitions, np.memmap):
+            self._transitions.flush()
+            self._cursor.flush()
+
+    def encode_state(self, state):
+        encoded = np.empty(len(state.encode()), dtype=self._status_dtype)
+        for token_id in state.get_token_ids():
+            if state.is_token_remaining(token_id):
+                encoded[token_id] = self._remaining
+            elif state.is_chosen_token(token_id):
+                encoded[token_id] = self._given
+            else:
+                i, j = state.get_token_id_status(token_id)
+                encoded[token_id] = self._cell_offset + i * self.size + j
+        return encoded
+
+    def decode_state(self, encoded):
+        state = State([None for i in range(len(encoded))], self.dimensions, self.size)
+        for token_id in range(len(encoded)):
+            if encoded[token_id] == self._given:
+                state.set_token_as_given(token_id)
+            elif encoded[token_id] >= self._cell_offset:
+                state.set_token_position(token_id, tuple(map(int, divmod(int(encoded[token_id]) - self._cell_offset,
+                                                                         self.size))))
+        return state
+
+    def encode_action(self, action):
+        return (action.token, action.position[0] * self.size + action.position[1],
+                -1 if action.returned_token is None else action.returned_token)
+
+    def decode_action(self, encoded):
+        token, cell, returned_token = map(int, encoded)
+        return Action(token=token, position=divmod(cell, self.size),
+                      returned_token=None if returned_token == -1 else returned_token)
+
+
+class ReplayUpdater:
+
+    def __init__(self, replay_buffer, database_interface, alpha=0.1, gamma=0.95):
+        self.replay_buffer = replay_buffer
+        self.database_interface = database_interface
+        self.alpha = alpha
+        self.gamma = gamma
+
+    def update(self, batch_size=256):
+        batch = self.replay_buffer.sample(batch_size)
+        states = [self.replay_buffer.decode_state(encoded) for encoded in batch["state"]]
+        actions = [self.replay_buffer.decode_action(encoded) for encoded in batch["action"]]
+        next_states = [self.replay_buffer.decode_state(encoded) for encoded in batch["next_state"]]
+        items = self.database_interface.find_many(states + next_states)
+
+        current_values = np.array([self._get_value(items.get(state.key), action)
+                                   for state, action in zip(states, actions)], dtype=np.float64)
+        next_values = np.array([get_best_value(next_state, items.get(next_state.key)) for next_state in next_states],
+                               dtype=np.float64)
+
+        targets = batch["reward"] + np.power(self.gamma, batch["steps_to_end"]) * next_values
+        new_values = (1 - self.alpha) * current_values + self.alpha * targets
+
+        for action, value in zip(actions, new_values):
+            action.value = float(value)
+        self.database_interface.bulk_update(list(zip(states, actions)))
+        return new_values
+
+    @staticmethod
+    def _get_value(state_actions, action):
+        if state_actions is None:
+            return 0.0
+        return state_actions["action_mapping"].get(action.encode(), 0.0)
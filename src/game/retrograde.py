@@ -0,0 +1,415 @@
+import argparse
+import bisect
+import glob
+import json
+import math
+import multiprocessing
+import os
+import pprint
+import time
+
+import numpy as np
+
+from game.quatro import QuartoGame, get_binary_dimensions
+from game.symmetry import decode_state_key, get_canonical_key, get_state_key
+
+
+# State.key of canonical positions, as the high and low halves of a 128 bit integer, sorted in that order
+_key_dtype = np.dtype([("high", "<u8"), ("low", "<u8")])
+_low_mask = (1 << 64) - 1
+# keys sampled to split a layer into shards, picked by a multiplicative hash
+_boundary_samples = 10000
+_sample_multiplier = 0x9E3779B97F4A7C15
+
+solutions = dict()
+
+
+class RetrogradeError(Exception):
+    pass
+
+
+def get_retrograde_values(path):
+    if path not in solutions:
+        solutions[path] = RetrogradeValues(path)
+    return solutions[path]
+
+
+def to_key_array(keys):
+    return np.array([(key >> 64, key & _low_mask) for key in keys], dtype=_key_dtype)
+
+
+def get_key(keys, index):
+    return int(keys["high"][index]) << 64 | int(keys["low"][index])
+
+
+def search_keys(keys, key, side="left"):
+    high, low = np.uint64(key >> 64), np.uint64(key & _low_mask)
+    start = int(np.searchsorted(keys["high"], high, side="left"))
+    end = int(np.searchsorted(keys["high"], high, side="right"))
+    return start + int(np.searchsorted(keys["low"][start:end], low, side=side))
+
+
+def read_binary(path, dtype):
+    # memory mapped, an empty file can't be
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def write_binary(path, data):
+    # written aside and renamed, a file that exists is always complete
+    with open(path + ".tmp", "wb") as binary_file:
+        binary_file.write(data.tobytes())
+    os.replace(path + ".tmp", path)
+
+
+def write_json(path, data):
+    with open(path + ".tmp", "w") as json_file:
+        json.dump(data, json_file)
+    os.replace(path + ".tmp", path)
+
+
+def merge_runs(runs, path, chunk_size):
+    # k-way merge of sorted runs that never holds more than a chunk of each, duplicates are dropped
+    positions = [0 for run in runs]
+    written = 0
+    with open(path + ".tmp", "wb") as merged_file:
+        while any(positions[i] < len(runs[i]) for i in range(len(runs))):
+            chunks = [runs[i][positions[i]:positions[i] + chunk_size] for i in range(len(runs))]
+            # everything up to the smallest last key of the runs that go on is known in full
+            bounds = [get_key(chunks[i], -1) for i in range(len(runs))
+                      if positions[i] + len(chunks[i]) < len(runs[i])]
+            parts = list()
+            for i in range(len(runs)):
+                taken = len(chunks[i]) if len(bounds) == 0 else search_keys(chunks[i], min(bounds), side="right")
+                parts.append(np.asarray(chunks[i][:taken]))
+                positions[i] += taken
+            merged = np.unique(np.concatenate(parts))
+            merged_file.write(merged.tobytes())
+            written += len(merged)
+    os.replace(path + ".tmp", path)
+    return written
+
+
+class PositionExpander:
+
+    def __init__(self, size, num_attributes):
+        self.size = size
+        self.num_attributes = num_attributes
+        self.num_tokens = 1 << num_attributes
+        self.game = QuartoGame(dimensions=get_binary_dimensions(num_attributes), size=size)
+
+    def get_key(self, cells, given):
+        return get_canonical_key(cells, given, self.size, self.num_attributes)[0]
+
+    def set_position(self, cells):
+        self.game.reset()
+        for cell in range(len(cells)):
+            if cells[cell] is not None:
+                self.game.place_token(self.game.tokens[cells[cell]], *divmod(cell, self.size))
+
+    def iterate_moves(self, key):
+        # per placement of the given token: 1 when it wins, 0 when the game ends in a tie, otherwise None and the
+        # keys of the positions handing over each remaining token leads to
+        cells, given = decode_state_key(key, self.size, self.num_tokens)
+        self.set_position(cells)
+        for i, j in self.game.get_free_cells():
+            self.game.place_token(self.game.tokens[given], i, j)
+            if self.game.completes_line(i, j):
+                yield 1, None
+            elif self.game.tie:
+                yield 0, None
+            else:
+                child_cells = list(cells)
+                child_cells[i * self.size + j] = given
+                yield None, [self.get_key(child_cells, self.game.get_token_unique_id(token))
+                             for token in self.game.remaining_tokens]
+            self.game.remove_token(i, j)
+
+
+class LayerValues:
+
+    def __init__(self, directory, layer):
+        self.directory = os.path.join(directory, "layer-{:02d}".format(layer))
+        with open(os.path.join(self.directory, "layer.json")) as layer_file:
+            self.description = json.load(layer_file)
+        self._boundaries = self.description["boundaries"]
+        self._positions = dict()
+        self._values = dict()
+
+    @property
+    def solved(self):
+        return all(os.path.exists(self.get_values_path(shard)) for shard in range(self.description["shards"]))
+
+    def get_positions_path(self, shard):
+        return os.path.join(self.directory, "positions-{}.bin".format(shard))
+
+    def get_values_path(self, shard):
+        return os.path.join(self.directory, "values-{}.bin".format(shard))
+
+    def get_shard(self, key):
+        return bisect.bisect_right(self._boundaries, key) - 1
+
+    def get_positions(self, shard):
+        if shard not in self._positions:
+            self._positions[shard] = read_binary(self.get_positions_path(shard), _key_dtype)
+        return self._positions[shard]
+
+    def get_value(self, key):
+        if self.description["shards"] == 0:
+            return None
+        shard = self.get_shard(key)
+        positions = self.get_positions(shard)
+        index = search_keys(positions, key)
+        if index == len(positions) or get_key(positions, index) != key:
+            return None
+        if shard not in self._values:
+            self._values[shard] = read_binary(self.get_values_path(shard), np.int8)
+        return int(self._values[shard][index])
+
+
+def _expand_shard(arguments):
+    directory, size, num_attributes, layer, shard, chunk_size = arguments
+    expander = PositionExpander(size, num_attributes)
+    positions = read_binary(os.path.join(directory, "layer-{:02d}".format(layer), "positions-{}.bin".format(shard)),
+                            _key_dtype)
+    runs_directory = os.path.join(directory, "layer-{:02d}".format(layer + 1), "runs")
+    # a shard that didn't finish is started over
+    for path in glob.glob(os.path.join(runs_directory, "{}-*.bin".format(shard))):
+        os.remove(path)
+    # a run is written once it holds chunk_size children, a single parent has up to a couple hundred of them
+    run, children = 0, set()
+    for index in range(len(positions)):
+        for outcome, child_keys in expander.iterate_moves(get_key(positions, index)):
+            if child_keys is not None:
+                children.update(child_keys)
+        if len(children) >= chunk_size or index == len(positions) - 1:
+            write_binary(os.path.join(runs_directory, "{}-{}.bin".format(shard, run)),
+                         np.unique(to_key_array(children)))
+            run, children = run + 1, set()
+    write_json(os.path.join(runs_directory, "{}.done".format(shard)), {"positions": len(positions)})
+    return shard
+
+
+def _merge_shard(arguments):
+    directory, layer, shard, boundaries, chunk_size = arguments
+    layer_directory = os.path.join(directory, "layer-{:02d}".format(layer))
+    runs = list()
+    for path in sorted(glob.glob(os.path.join(layer_directory, "runs", "*.bin"))):
+        run = read_binary(path, _key_dtype)
+        start = search_keys(run, boundaries[shard])
+        end = search_keys(run, boundaries[shard + 1]) if shard + 1 < len(boundaries) else len(run)
+        runs.append(run[start:end])
+    return shard, merge_runs(runs, os.path.join(layer_directory, "positions-{}.bin".format(shard)), chunk_size)
+
+
+def _solve_shard(arguments):
+    directory, size, num_attributes, layer, shard = arguments
+    expander = PositionExpander(size, num_attributes)
+    current, following = LayerValues(directory, layer), LayerValues(directory, layer + 1)
+    positions = current.get_positions(shard)
+    values = np.empty(len(positions), dtype=np.int8)
+    for index in range(len(positions)):
+        # the value for the player holding the given token, who picks the best placement and token to hand over
+        value = -1
+        for outcome, child_keys in expander.iterate_moves(get_key(positions, index)):
+            if outcome is not None:
+                value = max(value, outcome)
+            else:
+                value = max(value, max(-following.get_value(child_key) for child_key in child_keys))
+            if value == 1:
+                break
+        values[index] = value
+    write_binary(current.get_values_path(shard), values)
+    return shard
+
+
+class RetrogradeSolver:
+
+    def __init__(self, directory, size=4, num_attributes=4, processes=None, shard_size=1000000, chunk_size=100000):
+        if (1 << num_attributes) * (size * size + 1).bit_length() > 128:
+            raise RetrogradeError("Positions of this variant don't fit in 128 bit keys")
+        self.directory = directory
+        self.size = size
+        self.num_attributes = num_attributes
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+        self.shard_size = shard_size
+        self.chunk_size = chunk_size
+
+    def run(self):
+        self._check_manifest()
+        with multiprocessing.Pool(self.processes) as pool:
+            layer = 0
+            while True:
+                start_time = time.time()
+                description = self._build_layer(pool, layer)
+                yield {"stage": "forward", "layer": layer, "positions": description["positions"],
+                       "shards": description["shards"], "seconds": time.time() - start_time}
+                if description["positions"] == 0:
+                    break
+                layer += 1
+            # the last layer is empty, everything before it is solved from the end of the game back to its start
+            for layer in reversed(range(layer)):
+                start_time = time.time()
+                description = self._solve_layer(pool, layer)
+                yield {"stage": "backward", "layer": layer, "positions": description["positions"],
+                       "shards": description["shards"], "seconds": time.time() - start_time}
+
+    def _check_manifest(self):
+        path = os.path.join(self.directory, "manifest.json")
+        # solves keyed by anything but the canonical State.key have no key entry
+        manifest = {"size": self.size, "num_attributes": self.num_attributes, "key": "state"}
+        if os.path.exists(path):
+            with open(path) as manifest_file:
+                if json.load(manifest_file) != manifest:
+                    raise RetrogradeError("{} holds the solve of another game variant or key".format(self.directory))
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            write_json(path, manifest)
+
+    def _get_layer_directory(self, layer):
+        return os.path.join(self.directory, "layer-{:02d}".format(layer))
+
+    def _build_layer(self, pool, layer):
+        layer_directory = self._get_layer_directory(layer)
+        description_path = os.path.join(layer_directory, "layer.json")
+        if os.path.exists(description_path):
+            with open(description_path) as description_file:
+                return json.load(description_file)
+        os.makedirs(os.path.join(layer_directory, "runs"), exist_ok=True)
+
+        if layer == 0:
+            # every empty board with a token handed over is the same position up to symmetry
+            expander = PositionExpander(self.size, self.num_attributes)
+            write_binary(os.path.join(layer_directory, "positions-0.bin"),
+                         to_key_array([expander.get_key([None for i in range(self.size * self.size)], 0)]))
+            description = {"shards": 1, "boundaries": [0], "positions": 1}
+            write_json(description_path, description)
+            return description
+
+        previous = LayerValues(self.directory, layer - 1).description
+        runs_directory = os.path.join(layer_directory, "runs")
+        pending = [shard for shard in range(previous["shards"])
+                   if not os.path.exists(os.path.join(runs_directory, "{}.done".format(shard)))]
+        for shard in pool.imap_unordered(_expand_shard, [(self.directory, self.size, self.num_attributes, layer - 1,
+                                                           shard, self.chunk_size) for shard in pending]):
+            pass
+
+        boundaries = self._get_boundaries(layer_directory)
+        pending = [shard for shard in range(len(boundaries))
+                   if not os.path.exists(os.path.join(layer_directory, "positions-{}.bin".format(shard)))]
+        for shard, count in pool.imap_unordered(_merge_shard, [(self.directory, layer, shard, boundaries,
+                                                                self.chunk_size) for shard in pending]):
+            pass
+        positions = sum(os.path.getsize(os.path.join(layer_directory, "positions-{}.bin".format(shard)))
+                        for shard in range(len(boundaries))) // _key_dtype.itemsize
+        description = {"shards": len(boundaries) if positions > 0 else 0, "boundaries": boundaries,
+                       "positions": positions}
+        write_json(description_path, description)
+        for path in glob.glob(os.path.join(runs_directory, "*")):
+            os.remove(path)
+        return description
+
+    def _get_boundaries(self, layer_directory):
+        # shards split the key range at quantiles sampled from the runs, kept so a resumed merge splits alike
+        path = os.path.join(layer_directory, "boundaries.json")
+        if os.path.exists(path):
+            with open(path) as boundaries_file:
+                return json.load(boundaries_file)
+        run_paths = glob.glob(os.path.join(layer_directory, "runs", "*.bin"))
+        total = sum(os.path.getsize(run_path) // _key_dtype.itemsize for run_path in run_paths)
+        # a key is sampled or not whatever run it is in, so the keys several runs share are only counted once
+        # and the sample tells how many distinct positions the layer has
+        rate = min(1.0, _boundary_samples / max(1, total))
+        samples = set()
+        for run_path in run_paths:
+            run = read_binary(run_path, _key_dtype)
+            if rate < 1:
+                run = run[(run["high"] ^ run["low"]) * np.uint64(_sample_multiplier) < np.uint64(rate * 2 ** 64)]
+            samples.update(get_key(run, index) for index in range(len(run)))
+        samples = sorted(samples)
+        num_shards = max(1, min(len(samples), math.ceil(len(samples) / rate / self.shard_size)))
+        boundaries = [0] + [samples[i * len(samples) // num_shards] for i in range(1, num_shards)]
+        write_json(path, boundaries)
+        return boundaries
+
+    def _solve_layer(self, pool, layer):
+        values = LayerValues(self.directory, layer)
+        pending = [shard for shard in range(values.description["shards"])
+                   if not os.path.exists(values.get_values_path(shard))]
+        for shard in pool.imap_unordered(_solve_shard, [(self.directory, self.size, self.num_attributes, layer, shard)
+                                                         for shard in pending]):
+            pass
+        return values.description
+
+
+class RetrogradeValues:
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json")) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.size = manifest["size"]
+        self.num_attributes = manifest["num_attributes"]
+        self._expander = PositionExpander(self.size, self.num_attributes)
+        self._layers = dict()
+        # by the State.key of the positions asked about, self-play keeps coming back to the same ones
+        self._keys = dict()
+        self._action_values = dict()
+
+    def get_value(self, cells, given):
+        # for the player holding the given token, 1 won, -1 lost, 0 tie, None when the layer isn't solved
+        layer = sum(1 for cell in cells if cell is not None)
+        if layer not in self._layers:
+            if not os.path.exists(os.path.join(self.directory, "layer-{:02d}".format(layer), "layer.json")):
+                return None
+            layer_values = LayerValues(self.directory, layer)
+            if not layer_values.solved:
+                return None
+            self._layers[layer] = layer_values
+        key = get_state_key(cells, given, self.size, 1 << self.num_attributes)
+        if key not in self._keys:
+            self._keys[key] = self._expander.get_key(cells, given)
+        return self._layers[layer].get_value(self._keys[key])
+
+    def get_action_value(self, cells, given, cell, returned_id):
+        # value of placing the given token on cell and handing over returned_id, for the player doing it
+        key = (get_state_key(cells, given, self.size, 1 << self.num_attributes), cell, returned_id)
+        if self._action_values.get(key) is None:
+            self._action_values[key] = self._get_action_value(cells, given, cell, returned_id)
+        return self._action_values[key]
+
+    def _get_action_value(self, cells, given, cell, returned_id):
+        self._expander.set_position(cells)
+        game = self._expander.game
+        i, j = divmod(cell, self.size)
+        game.place_token(game.tokens[given], i, j)
+        if game.completes_line(i, j):
+            return 1
+        if game.tie or returned_id is None:
+            return 0
+        child_cells = list(cells)
+        child_cells[cell] = given
+        value = self.get_value(child_cells, returned_id)
+        return None if value is None else -value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", dest="output", help="Directory of the solve, rerun it to resume",
+                        required=True)
+    parser.add_argument("-s", "--size", dest="size", help="Board side length", type=int,
+                        required=False, default=4)
+    parser.add_argument("-k", "--attributes", dest="attributes", help="Number of binary token attributes", type=int,
+                        required=False, default=4)
+    parser.add_argument("-j", "--processes", dest="processes", help="Worker processes", type=int,
+                        required=False, default=None)
+    parser.add_argument("--shard-size", dest="shard_size", help="Positions per shard", type=int,
+                        required=False, default=1000000)
+    parser.add_argument("--chunk-size", dest="chunk_size", help="Positions held in memory per run and merged run",
+                        type=int, required=False, default=100000)
+    args = parser.parse_args()
+    solver = RetrogradeSolver(args.output, size=args.size, num_attributes=args.attributes,
+                              processes=args.processes, shard_size=args.shard_size, chunk_size=args.chunk_size)
+    for stage_result in solver.run():
+        pprint.pprint(stage_result)
@@ -0,0 +1,116 @@
+from game.quatro import get_line_masks
+
+
+_exact = 0
+_lower = 1
+_upper = 2
+
+
+class NegamaxSearch:
+
+    def __init__(self, game, depth=2):
+        self.game = game
+        self.depth = depth
+        self.nodes = 0
+        # canonical hash of the position and given token -> (depth, bound, value), moves aren't kept since a
+        # symmetric position needs them in its own frame
+        self._transpositions = dict()
+
+    def get_best_move(self, given_id):
+        # (value, (i, j), token id to hand over), the value is for the player holding the given token:
+        # 1 forced win, -1 forced loss, in between a tie or the evaluation of the positions the depth stops at
+        return self._search(given_id, self.depth, -1, 1)
+
+    def get_move_values(self, given_id):
+        # every placement with every token that is safe to hand over after it, searched as deep as get_best_move
+        token = self.game.tokens[given_id]
+        moves = list()
+        for i, j in self.game.get_free_cells():
+            self.game.place_token(token, i, j)
+            _, safe_tokens = self.game.get_threat_analysis()
+            if self.game.winner or len(self.game.remaining_tokens) == 0 or self.game.tie or len(safe_tokens) == 0:
+                value, returned_id = self._get_placement_value(self.depth, -1, 1)
+                moves.append((value, (i, j), returned_id))
+            else:
+                moves.extend((-self._negamax(returned_id, self.depth - 1, -1, 1), (i, j), returned_id)
+                             for returned_id in sorted(self.game.get_token_unique_id(t) for t in safe_tokens))
+            self.game.remove_token(i, j)
+        return moves
+
+    def _negamax(self, given_id, depth, alpha, beta):
+        key = self.game.get_zobrist_hash(given_id, canonical=True)
+        if key in self._transpositions:
+            stored_depth, bound, value = self._transpositions[key]
+            if stored_depth >= depth and (bound == _exact or bound == _lower and value >= beta or
+                                          bound == _upper and value <= alpha):
+                return value
+        value = self._search(given_id, depth, alpha, beta)[0]
+        bound = _upper if value <= alpha else _lower if value >= beta else _exact
+        self._transpositions[key] = (depth, bound, value)
+        return value
+
+    def _search(self, given_id, depth, alpha, beta):
+        self.nodes += 1
+        token = self.game.tokens[given_id]
+        free_cells = self.game.get_free_cells()
+
+        winning_cells, _ = self.game.get_threat_analysis(token)
+        if len(winning_cells) > 0:
+            return 1, min(winning_cells), None
+        if depth == 0:
+            return self._evaluate(token, free_cells)
+
+        best = None
+        for i, j in free_cells:
+            self.game.place_token(token, i, j)
+            value, returned_id = self._get_placement_value(depth, alpha, beta)
+            self.game.remove_token(i, j)
+            if best is None or value > best[0]:
+                best = (value, (i, j), returned_id)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        return best
+
+    def _get_placement_value(self, depth, alpha, beta):
+        # (value, token id to hand over) once the given token is placed
+        _, safe_tokens = self.game.get_threat_analysis()
+        if self.game.winner:
+            return 1, None
+        if len(self.game.remaining_tokens) == 0 or self.game.tie:
+            return 0, None
+        if len(safe_tokens) == 0:
+            # whatever is handed over wins right away
+            return -1, min(self.game.get_token_unique_id(t) for t in self.game.remaining_tokens)
+        # handing over any other token loses right away, none of them can be better
+        best = None
+        for returned_id in sorted(self.game.get_token_unique_id(t) for t in safe_tokens):
+            value = -self._negamax(returned_id, depth - 1, -beta, -alpha)
+            if best is None or value > best[0]:
+                best = (value, returned_id)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        return best
+
+    def _evaluate(self, token, free_cells):
+        # the share of the remaining tokens still safe to hand over after the best placement, less the lines left
+        # open for threats to come, within +-0.2 so it never reads as a decided game, a placement that leaves
+        # nothing safe is a loss whatever the depth
+        num_lines = len(get_line_masks(self.game.size, self.game.advanced))
+        best = None
+        for i, j in free_cells:
+            self.game.place_token(token, i, j)
+            _, safe_tokens = self.game.get_threat_analysis()
+            if len(self.game.remaining_tokens) == 0 or self.game.tie:
+                result = (0, (i, j), None)
+            elif len(safe_tokens) == 0:
+                result = (-1, (i, j), min(self.game.get_token_unique_id(t) for t in self.game.remaining_tokens))
+            else:
+                result = (len(safe_tokens) / len(self.game.remaining_tokens) / 5 - 0.1 -
+                          self.game.count_open_lines() / num_lines / 10, (i, j),
+                          min(self.game.get_token_unique_id(t) for t in safe_tokens))
+            self.game.remove_token(i, j)
+            if best is None or result[0] > best[0]:
+                best = result
+        return best
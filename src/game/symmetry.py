@@ -0,0 +1,125 @@
+import itertools
+
+from game.core_elements import State
+
+_empty = 255
+
+
+class PositionSymmetry:
+
+    def __init__(self, cell_permutation, token_permutation, flipped_attributes):
+        self.cell_permutation = tuple(cell_permutation)
+        self.token_permutation = tuple(token_permutation)
+        self.flipped_attributes = flipped_attributes
+        self._inverse_cells = {self.cell_permutation[i]: i for i in range(len(self.cell_permutation))}
+        self._inverse_tokens = {self.token_permutation[i]: i for i in range(len(self.token_permutation))}
+
+    def transform_cell(self, cell):
+        return self.cell_permutation[cell]
+
+    def transform_token(self, token_id):
+        return None if token_id is None else self.token_permutation[token_id] ^ self.flipped_attributes
+
+    def inverse_cell(self, cell):
+        return self._inverse_cells[cell]
+
+    def inverse_token(self, token_id):
+        return None if token_id is None else self._inverse_tokens[token_id ^ self.flipped_attributes]
+
+    def transform_position(self, cells, given):
+        transformed = [None for i in cells]
+        for cell in range(len(cells)):
+            transformed[self.cell_permutation[cell]] = self.transform_token(cells[cell])
+        return transformed, self.transform_token(given)
+
+
+_board_symmetries = dict()
+
+
+def get_board_symmetries(size):
+    # the dihedral group of the square keeps rows, columns, diagonals and corners together
+    if size not in _board_symmetries:
+        last = size - 1
+        maps = [lambda i, j: (i, j), lambda i, j: (j, last - i), lambda i, j: (last - i, last - j),
+                lambda i, j: (last - j, i), lambda i, j: (i, last - j), lambda i, j: (last - i, j),
+                lambda i, j: (j, i), lambda i, j: (last - j, last - i)]
+        _board_symmetries[size] = [tuple(cell_map(i, j)[0] * size + cell_map(i, j)[1]
+                                         for i, j in itertools.product(range(size), repeat=2))
+                                   for cell_map in maps]
+    return _board_symmetries[size]
+
+
+_token_permutations = dict()
+
+
+def get_token_permutations(num_attributes):
+    # reordering the attributes reorders the bits of every token id
+    if num_attributes not in _token_permutations:
+        _token_permutations[num_attributes] = [
+            tuple(sum((token_id >> bit & 1) << bit_permutation[bit] for bit in range(num_attributes))
+                  for token_id in range(1 << num_attributes))
+            for bit_permutation in itertools.permutations(range(num_attributes))]
+    return _token_permutations[num_attributes]
+
+
+def iterate_symmetries(size, num_attributes, given=None):
+    # flipping attributes can always send the given token to 0, which leaves a single flip per permutation
+    for cell_permutation in get_board_symmetries(size):
+        for token_permutation in get_token_permutations(num_attributes):
+            if given is not None:
+                yield PositionSymmetry(cell_permutation, token_permutation, token_permutation[given])
+            else:
+                for flipped_attributes in range(1 << num_attributes):
+                    yield PositionSymmetry(cell_permutation, token_permutation, flipped_attributes)
+
+
+def encode_position(cells, given):
+    return bytes(_empty if token_id is None else token_id for token_id in [*cells, given])
+
+
+def canonicalize(cells, given, size, num_attributes):
+    best_key, best_symmetry = None, None
+    for symmetry in iterate_symmetries(size, num_attributes, given):
+        key = encode_position(*symmetry.transform_position(cells, given))
+        if best_key is None or key < best_key:
+            best_key, best_symmetry = key, symmetry
+    return best_key, best_symmetry
+
+
+def decode_position(key):
+    values = [None if value == _empty else value for value in key]
+    return values[:-1], values[-1]
+
+
+def get_state_key(cells, given, size, num_tokens):
+    # the State.key of a position: every token's code, the first token in the most significant bits
+    bits_per_token = (size * size + State._cell_offset - 1).bit_length()
+    codes = [State._remaining_code for token_id in range(num_tokens)]
+    for cell in range(len(cells)):
+        if cells[cell] is not None:
+            codes[cells[cell]] = State._cell_offset + cell
+    if given is not None:
+        codes[given] = State._given_code
+    key = 0
+    for code in codes:
+        key = key << bits_per_token | code
+    return key
+
+
+def decode_state_key(key, size, num_tokens):
+    bits_per_token = (size * size + State._cell_offset - 1).bit_length()
+    cells, given = [None for i in range(size * size)], None
+    for token_id in reversed(range(num_tokens)):
+        code = key & (1 << bits_per_token) - 1
+        key >>= bits_per_token
+        if code == State._given_code:
+            given = token_id
+        elif code >= State._cell_offset:
+            cells[code - State._cell_offset] = token_id
+    return cells, given
+
+
+def get_canonical_key(cells, given, size, num_attributes):
+    # the State.key of the canonical position, with the symmetry that takes the position there
+    key, symmetry = canonicalize(cells, given, size, num_attributes)
+    return get_state_key(*decode_position(key), size, 1 << num_attributes), symmetry
@@ -0,0 +1,77 @@
+import random
+
+import numpy as np
+
+from game.symmetry import get_board_symmetries, get_token_permutations
+
+_keys = dict()
+_tables = dict()
+
+
+def get_linear_keys(size, num_attributes):
+    # a token on a cell is the cell key xored with the attribute key of every bit it has, so flipping attributes
+    # changes a hash by the attribute keys of the occupied cells and never needs tables of its own
+    if (size, num_attributes) not in _keys:
+        random_state = random.Random("zobrist-linear-{}-{}".format(size, num_attributes))
+        cells = np.array([random_state.getrandbits(64) for cell in range(size * size)], dtype=np.uint64)
+        attributes = np.array([[random_state.getrandbits(64) for bit in range(num_attributes)]
+                               for cell in range(size * size)], dtype=np.uint64)
+        _keys[(size, num_attributes)] = (cells, attributes, random_state.getrandbits(64))
+    return _keys[(size, num_attributes)]
+
+
+def get_symmetric_tables(size, num_attributes):
+    # over the board x attribute permutation symmetries: the key of every token on every cell, the attribute keys
+    # of every cell, and the attributes to flip so that the given token becomes token 0
+    if (size, num_attributes) not in _tables:
+        num_tokens = 1 << num_attributes
+        cell_keys, attribute_keys, given_key = get_linear_keys(size, num_attributes)
+        cell_maps = np.array([cell_permutation for cell_permutation in get_board_symmetries(size)
+                              for token_permutation in get_token_permutations(num_attributes)])
+        token_maps = np.array([token_permutation for cell_permutation in get_board_symmetries(size)
+                               for token_permutation in get_token_permutations(num_attributes)])
+        token_bits = (np.arange(num_tokens)[:, np.newaxis] >> np.arange(num_attributes) & 1).astype(bool)
+
+        token_keys = np.zeros((size * size, num_tokens), dtype=np.uint64)
+        for bit in range(num_attributes):
+            token_keys ^= np.where(token_bits[:, bit], attribute_keys[:, bit, np.newaxis], np.uint64(0))
+        token_keys ^= cell_keys[:, np.newaxis]
+
+        _tables[(size, num_attributes)] = (
+            np.ascontiguousarray(token_keys[cell_maps[:, np.newaxis, :],
+                                            token_maps[:, :, np.newaxis]].transpose(1, 2, 0)),
+            np.ascontiguousarray(attribute_keys[cell_maps].transpose(1, 0, 2)),
+            np.ascontiguousarray(token_bits[token_maps].transpose(1, 0, 2)),
+            given_key)
+    return _tables[(size, num_attributes)]
+
+
+class SymmetricZobristHashes:
+
+    def __init__(self, size, num_attributes):
+        self._placed, self._attributes, self._flips, self._given = get_symmetric_tables(size, num_attributes)
+        self.num_attributes = num_attributes
+        # the hash of the position seen through every board and attribute permutation symmetry, and the xor of
+        # the attribute keys of its occupied cells
+        self.hashes = np.zeros(self._placed.shape[2], dtype=np.uint64)
+        self.occupied = np.zeros(self._attributes.shape[1:], dtype=np.uint64)
+
+    def toggle(self, token_id, cell):
+        # placing and removing are the same xor
+        self.hashes ^= self._placed[token_id, cell]
+        self.occupied ^= self._attributes[cell]
+
+    def reset(self):
+        self.hashes[:] = 0
+        self.occupied[:] = 0
+
+    def get_canonical_hash(self, given_id=None):
+        if given_id is not None:
+            # the flips sending the given token to 0, as canonical positions have it
+            flipped = np.bitwise_xor.reduce(np.where(self._flips[given_id], self.occupied, np.uint64(0)), axis=1)
+            return int((self.hashes ^ flipped).min()) ^ self._given
+        # without a given token every flip counts, worked out on the fly
+        hashes = self.hashes[:, np.newaxis]
+        for bit in range(self.num_attributes):
+            hashes = np.concatenate([hashes, hashes ^ self.occupied[:, bit, np.newaxis]], axis=1)
+        return int(hashes.min())
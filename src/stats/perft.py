@@ -0,0 +1,186 @@
+import argparse
+import multiprocessing
+import pprint
+import time
+
+from game.quatro import QuartoGame, get_binary_dimensions
+from game.symmetry import canonicalize, decode_position
+
+
+# canonical positions by depth as game.symmetry counted them (the 8 board symmetries of the square with attribute
+# permutations and flips), cross checked against canonicalizing every position of the raw enumeration. They aren't
+# independent counts, only a snapshot that catches regressions of the canonicalization, and a group with more board
+# symmetries would count fewer positions
+CANONICAL_COUNT_SNAPSHOTS = {
+    (3, 2): [1, 6, 20, 38, 59],
+    (4, 4): [1, 12, 381]
+}
+
+
+def get_expected_count(size, num_attributes, depth):
+    # nobody can have won before a line has been filled, until then every move stays legal
+    num_cells, num_tokens = size * size, 1 << num_attributes
+    if depth >= min(size, num_tokens):
+        return None
+    count = 1
+    for i in range(depth):
+        count *= (num_cells - i) * (num_tokens - 1 - i)
+    return count
+
+
+def _count_root_move(arguments):
+    size, num_attributes, cell, returned_id, depth = arguments
+    perft = Perft(size, num_attributes)
+    perft.game.place_token(perft.game.tokens[0], *divmod(cell, size))
+    if returned_id is None:
+        return 1 if depth == 0 else 0, 1
+    return perft.count(returned_id, depth), perft.nodes
+
+
+def _expand_canonical(arguments):
+    size, num_attributes, keys = arguments
+    perft = Perft(size, num_attributes)
+    children = set()
+    for key in keys:
+        children.update(perft.get_canonical_children(key))
+    return children
+
+
+class Perft:
+
+    def __init__(self, size=4, num_attributes=4):
+        self.size = size
+        self.num_attributes = num_attributes
+        self.game = QuartoGame(dimensions=get_binary_dimensions(num_attributes), size=size)
+        self.nodes = 0
+
+    def count(self, given_id, depth):
+        # leaves at exactly depth moves (a placement and the token handed over) from the current position
+        self.nodes += 1
+        if depth == 0:
+            return 1
+        leaves = 0
+        token = self.game.tokens[given_id]
+        for i, j in self.game.get_free_cells():
+            self.game.place_token(token, i, j)
+            if self.game.completes_line(i, j) or self.game.tie:
+                # the game is over, that's a single move whatever would have been handed over
+                self.nodes += 1
+                leaves += 1 if depth == 1 else 0
+            else:
+                for returned_token in list(self.game.remaining_tokens):
+                    leaves += self.count(self.game.get_token_unique_id(returned_token), depth - 1)
+            self.game.remove_token(i, j)
+        return leaves
+
+    def get_root_moves(self):
+        moves = list()
+        for i, j in self.game.get_free_cells():
+            self.game.place_token(self.game.tokens[0], i, j)
+            if self.game.completes_line(i, j) or self.game.tie:
+                moves.append((i * self.size + j, None))
+            else:
+                moves.extend((i * self.size + j, self.game.get_token_unique_id(returned_token))
+                             for returned_token in self.game.remaining_tokens)
+            self.game.remove_token(i, j)
+        return moves
+
+    def get_canonical_children(self, key):
+        # finished games are counted as positions but have nothing to hand over, so nothing follows them
+        cells, given = decode_position(key)
+        if given is None:
+            return set()
+        self.game.reset()
+        for cell in range(len(cells)):
+            if cells[cell] is not None:
+                self.game.place_token(self.game.tokens[cells[cell]], *divmod(cell, self.size))
+        children = set()
+        for i, j in self.game.get_free_cells():
+            self.nodes += 1
+            self.game.place_token(self.game.tokens[given], i, j)
+            child_cells = list(cells)
+            child_cells[i * self.size + j] = given
+            if self.game.completes_line(i, j) or self.game.tie:
+                children.add(canonicalize(child_cells, None, self.size, self.num_attributes)[0])
+            else:
+                for returned_token in self.game.remaining_tokens:
+                    children.add(canonicalize(child_cells, self.game.get_token_unique_id(returned_token),
+                                              self.size, self.num_attributes)[0])
+            self.game.remove_token(i, j)
+        return children
+
+
+class PerftRunner:
+
+    def __init__(self, size=4, num_attributes=4, processes=None, canonical=True):
+        self.size = size
+        self.num_attributes = num_attributes
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+        self.canonical = canonical
+        self.results = list()
+
+    def run(self, max_depth):
+        # every depth starts from an empty board with a token handed over, which is one position up to symmetry
+        root_moves = Perft(self.size, self.num_attributes).get_root_moves()
+        layer = {canonicalize([None for i in range(self.size * self.size)], 0, self.size, self.num_attributes)[0]}
+        with multiprocessing.Pool(self.processes) as pool:
+            for depth in range(max_depth + 1):
+                # raw counts start from an empty board with token 0 handed over, any other first token is symmetric
+                result = {"depth": depth, "first_token": 0}
+                start_time = time.time()
+                if depth == 0:
+                    leaves, nodes = 1, 1
+                else:
+                    counts = pool.map(_count_root_move, [(self.size, self.num_attributes, cell, returned_id,
+                                                          depth - 1) for cell, returned_id in root_moves])
+                    leaves, nodes = sum(x[0] for x in counts), sum(x[1] for x in counts) + 1
+                elapsed = time.time() - start_time
+                result["leaves"] = leaves
+                result["expected"] = get_expected_count(self.size, self.num_attributes, depth)
+                result["matches"] = result["expected"] is None or result["expected"] == leaves
+                result["nodes"] = nodes
+                result["seconds"] = elapsed
+                result["nodes_per_second"] = nodes / elapsed if elapsed > 0 else None
+
+                if self.canonical:
+                    if depth > 0:
+                        start_time = time.time()
+                        layer = self._expand_layer(pool, layer)
+                        result["canonical_seconds"] = time.time() - start_time
+                    result["canonical_positions"] = len(layer)
+                    snapshot = CANONICAL_COUNT_SNAPSHOTS.get((self.size, self.num_attributes), list())
+                    result["snapshot_canonical"] = snapshot[depth] if depth < len(snapshot) else None
+                    result["matches"] &= result["snapshot_canonical"] in (None, len(layer))
+                self.results.append(result)
+                yield result
+
+    def _expand_layer(self, pool, layer):
+        keys = sorted(layer)
+        chunk_size = max(1, len(keys) // (self.processes * 4))
+        chunks = [(self.size, self.num_attributes, keys[i:i + chunk_size]) for i in range(0, len(keys), chunk_size)]
+        next_layer = set()
+        for children in pool.imap_unordered(_expand_canonical, chunks):
+            next_layer.update(children)
+        return next_layer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--depth", dest="depth", help="Maximum depth in moves", type=int,
+                        required=False, default=3)
+    parser.add_argument("-s", "--size", dest="size", help="Board side length", type=int,
+                        required=False, default=4)
+    parser.add_argument("-k", "--attributes", dest="attributes", help="Number of binary token attributes", type=int,
+                        required=False, default=4)
+    parser.add_argument("-j", "--processes", dest="processes", help="Worker processes", type=int,
+                        required=False, default=None)
+    parser.add_argument("--raw-only", dest="canonical", help="Skip the canonical position counts",
+                        action="store_false")
+    args = parser.parse_args()
+    runner = PerftRunner(size=args.size, num_attributes=args.attributes, processes=args.processes,
+                         canonical=args.canonical)
+    print("Raw counts start from token 0 handed over, times {} for every first token".format(1 << args.attributes))
+    for depth_result in runner.run(args.depth):
+        pprint.pprint(depth_result)
+        if not depth_result["matches"]:
+            print("Counts don't match the expected ones at depth {}".format(depth_result["depth"]))
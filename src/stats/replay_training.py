@@ -0,0 +1,75 @@
+import argparse
+import pprint
+import time
+
+from game.complex_players import ReinforcedPlayer, get_memory_caches
+from game.game_controller import GameController
+from game.quatro import QuartoGame, get_binary_dimensions
+from game.replay_buffer import ReplayUpdater, get_replay_buffer
+
+
+class ReplayTrainer:
+
+    def __init__(self, name, path, capacity=1000000, size=4, num_attributes=4, games=100, updates=10, batch_size=256,
+                 alpha=0.1, gamma=0.95, exploration=0.05):
+        self.name = name
+        self.game = QuartoGame(dimensions=get_binary_dimensions(num_attributes), size=size)
+        self.replay_buffer = get_replay_buffer(path, capacity, self.game.dimensions, size)
+        self.games = games
+        self.updates = updates
+        self.batch_size = batch_size
+        self.exploration = exploration
+        # the players read through the same cache the updater writes to, they see what it learned right away
+        self.updater = ReplayUpdater(self.replay_buffer, get_memory_caches(name)[0], alpha=alpha, gamma=gamma)
+
+    def run(self, rounds):
+        # every round self-play fills the buffer, then batches sampled from all of it are learned
+        for round_number in range(rounds):
+            start_time = time.time()
+            outcomes = {"first_wins": 0, "ties": 0, "second_wins": 0}
+            for i in range(self.games):
+                self.game.reset()
+                players = [ReinforcedPlayer("{} {}".format(self.name, order), game_instance=self.game,
+                                            memory=self.name, replay_buffer=self.replay_buffer,
+                                            exploration=self.exploration)
+                           for order in (1, 2)]
+                winner = GameController(game=self.game, player1=players[0], player2=players[1]).play()
+                if winner is None:
+                    outcomes["ties"] += 1
+                elif winner is players[0]:
+                    outcomes["first_wins"] += 1
+                else:
+                    outcomes["second_wins"] += 1
+            self.replay_buffer.flush()
+            play_time = time.time() - start_time
+            for i in range(self.updates):
+                self.updater.update(self.batch_size)
+            yield dict(outcomes, round=round_number, transitions=len(self.replay_buffer), play_seconds=play_time,
+                       update_seconds=time.time() - start_time - play_time)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--name", dest="name", help="Name of the memory both players learn", required=True)
+    parser.add_argument("-o", "--buffer", dest="buffer", help="Replay buffer file, created or resumed",
+                        required=True)
+    parser.add_argument("-c", "--capacity", dest="capacity", help="Transitions the buffer keeps", type=int,
+                        required=False, default=1000000)
+    parser.add_argument("-r", "--rounds", dest="rounds", help="Rounds of self-play and updates", type=int,
+                        required=False, default=10)
+    parser.add_argument("-g", "--games", dest="games", help="Self-play games per round", type=int,
+                        required=False, default=100)
+    parser.add_argument("-u", "--updates", dest="updates", help="Sampled batches learned per round", type=int,
+                        required=False, default=10)
+    parser.add_argument("-b", "--batch-size", dest="batch_size", help="Transitions per batch", type=int,
+                        required=False, default=256)
+    parser.add_argument("-s", "--size", dest="size", help="Board side length", type=int,
+                        required=False, default=4)
+    parser.add_argument("-k", "--attributes", dest="attributes", help="Number of binary token attributes", type=int,
+                        required=False, default=4)
+    args = parser.parse_args()
+    trainer = ReplayTrainer(args.name, args.buffer, capacity=args.capacity, size=args.size,
+                            num_attributes=args.attributes, games=args.games, updates=args.updates,
+                            batch_size=args.batch_size)
+    for round_result in trainer.run(args.rounds):
+        pprint.pprint(round_result)
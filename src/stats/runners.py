@@ -2,9 +2,11 @@ import pprint
 
 from pymongo import MongoClient
 
-from game.game_controller import RunInstance, get_player_type
+from game.game_controller import RunInstance
+from game.game_records import GameRecordWriter
+from game.player_registry import get_player_type, get_player_type_names
+from game.quatro import get_binary_dimensions
 import argparse
-from scipy import stats
 import datetime
 
 
@@ -13,13 +15,17 @@ DATABASE = "Quarto"
 
 class StatsRunner:
 
-    def __init__(self, player1_type, player2_type, num_repetitions=1000, batch=None, verbose=False):
+    def __init__(self, player1_type, player2_type, num_repetitions=1000, batch=None, verbose=False,
+                 dimensions=None, size=None, recorder=None):
         self.stats = dict()
         self.data = None
         self.num_repetitions = num_repetitions
         self.verbose = verbose
         self.p1_type = player1_type
         self.p2_type = player2_type
+        self.dimensions = dimensions
+        self.size = size
+        self.recorder = recorder
         if batch is None:
             batch = num_repetitions*2
         self.batch = batch
@@ -30,8 +36,8 @@ class StatsRunner:
         self.stats["repetitions"] = 0
         for i in range(self.num_repetitions):
             start_time = time.time()
-            self.data.append(RunInstance(player1_type=self.p1_type, player2_type=self.p2_type, verbose=self.verbose)
-                             .run())
+            self.data.append(RunInstance(player1_type=self.p1_type, player2_type=self.p2_type, verbose=self.verbose,
+                                         dimensions=self.dimensions, size=self.size, recorder=self.recorder).run())
             end_time = time.time()
             self.run_times.append(end_time - start_time)
             self.stats["repetitions"] += 1
@@ -74,6 +80,8 @@ class StatsRunner:
             self.stats["averages"][key] = val/len(self.data)
 
     def compute_statistical_significance(self):
+        # scipy takes longer to import than a whole game takes to play, only pay for it here
+        from scipy import stats
         if "event_counts" not in self.stats:
             self.compute_event_counts()
         num_result_type = len(self.stats["event_counts"]) - \
@@ -95,16 +103,28 @@ class StatsRunner:
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-p1", "--player1-type", dest="player1", help="Player 1 type",
-                        choices=["terminal", "random", "ai"], required=False, default="ai")
+                        choices=get_player_type_names(), required=False, default="ai")
     parser.add_argument("-p2", "--player2-type", dest="player2", help="Player 2 type",
-                        choices=["terminal", "random", "ai"], required=False, default="ai")
+                        choices=get_player_type_names(), required=False, default="ai")
     parser.add_argument("-r", "--repetitions", dest="repetitions", help="Number of repetitions", type=int,
                         required=False, default=100)
     parser.add_argument("-b", "--batch", dest="batch", help="Batch Size", type=int,
                         required=False, default=None)
+    parser.add_argument("-s", "--size", dest="size", help="Board side length", type=int,
+                        required=False, default=None)
+    parser.add_argument("-k", "--attributes", dest="attributes", help="Number of binary token attributes", type=int,
+                        required=False, default=None)
+    parser.add_argument("-o", "--record", dest="record", help="Append every game to this record file",
+                        required=False, default=None)
     args = parser.parse_args()
+    dimensions = get_binary_dimensions(args.attributes) if args.attributes is not None else \
+        RunInstance.get_default_dimensions()
+    recorder = None
+    if args.record is not None:
+        recorder = GameRecordWriter(args.record, size=args.size or len(dimensions), num_attributes=len(dimensions))
     runner = StatsRunner(player1_type=get_player_type(args.player1), player2_type=get_player_type(args.player2),
-                         num_repetitions=args.repetitions, batch=args.batch)
+                         num_repetitions=args.repetitions, batch=args.batch, size=args.size,
+                         dimensions=dimensions, recorder=recorder)
     import time
     for b in runner.run():
         print(str(runner))
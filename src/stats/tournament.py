@@ -0,0 +1,198 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import pprint
+import random
+
+import numpy as np
+
+from game.game_controller import GameController
+from game.player_registry import get_player_type, get_player_type_names
+from game.quatro import QuartoGame, get_binary_dimensions
+
+
+def get_pairing_key(first, second, size, num_attributes):
+    # the whole configurations go in the key, so changing any parameter of a player plays its pairings again
+    return json.dumps([first, second, size, num_attributes], sort_keys=True)
+
+
+def _play_pairing(arguments):
+    key, first, second, num_games, size, num_attributes, seed = arguments
+    # forked workers would otherwise all draw the same games
+    random.seed(seed)
+    game = QuartoGame(dimensions=get_binary_dimensions(num_attributes), size=size)
+    result = {"games": num_games, "first_wins": 0, "ties": 0, "second_wins": 0}
+    for i in range(num_games):
+        game.reset()
+        # fresh players every game like RunInstance. Nobody learns during the tournament, parallel pairings would
+        # otherwise write to the same memories and the ratings would depend on the order games are played in
+        players = [get_player_type(config["type"])(config["name"], game_instance=game,
+                                                   **dict(config.get("kwargs", dict()), learning=False))
+                   for config in (first, second)]
+        winner = GameController(game=game, player1=players[0], player2=players[1]).play()
+        if winner is None:
+            result["ties"] += 1
+        elif winner is players[0]:
+            result["first_wins"] += 1
+        else:
+            result["second_wins"] += 1
+    return key, result
+
+
+def get_bradley_terry_strengths(wins, games, prior=1.0, iterations=10000, tolerance=1e-9):
+    # minorization-maximization, wins[i][j] is what i scored against j (a tie is worth half), a tied virtual game
+    # per pairing keeps players that never won or never lost at a finite strength
+    played = games > 0
+    wins = wins + prior / 2 * played
+    games = games + prior * played
+    total_wins = wins.sum(axis=1)
+    strengths = np.ones(len(wins))
+    for i in range(iterations):
+        updated = total_wins / (games / (strengths[:, np.newaxis] + strengths[np.newaxis, :])).sum(axis=1)
+        updated /= np.exp(np.log(updated).mean())
+        converged = np.abs(np.log(updated / strengths)).max() < tolerance
+        strengths = updated
+        if converged:
+            break
+    return strengths
+
+
+def get_elo_ratings(strengths, mean_rating=1500):
+    return mean_rating + 400 * np.log10(strengths)
+
+
+class Tournament:
+
+    def __init__(self, configurations, games_per_pairing=100, size=None, num_attributes=4, processes=None,
+                 cache_path=None, bootstrap=200, seed=None):
+        names = [config["name"] for config in configurations]
+        if len(set(names)) != len(names):
+            raise ValueError("Every player configuration needs its own name")
+        self.configurations = configurations
+        self.games_per_pairing = games_per_pairing
+        self.size = size if size is not None else num_attributes
+        self.num_attributes = num_attributes
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+        self.cache_path = cache_path
+        self.bootstrap = bootstrap
+        self.seed = seed
+        self.results = dict()
+
+    def get_pairings(self):
+        # both seat orders, the player placing first is not on equal footing with the one handing over first
+        return [(first, second) for first, second in itertools.permutations(self.configurations, 2)]
+
+    def run(self):
+        cache = self._load_cache()
+        random_state = random.Random(self.seed)
+        tasks = list()
+        for first, second in self.get_pairings():
+            key = get_pairing_key(first, second, self.size, self.num_attributes)
+            if key in cache and cache[key]["games"] >= self.games_per_pairing:
+                self.results[(first["name"], second["name"])] = cache[key]
+            else:
+                tasks.append((key, first, second, self.games_per_pairing, self.size, self.num_attributes,
+                              random_state.getrandbits(32)))
+        if len(tasks) > 0:
+            pairing_names = {task[0]: (task[1]["name"], task[2]["name"]) for task in tasks}
+            with multiprocessing.Pool(min(self.processes, len(tasks))) as pool:
+                for key, result in pool.imap_unordered(_play_pairing, tasks):
+                    self.results[pairing_names[key]] = result
+                    cache[key] = result
+                    # saved after every pairing so an interrupted tournament picks up where it stopped
+                    self._save_cache(cache)
+        return self.get_standings()
+
+    def get_score_matrices(self):
+        names = [config["name"] for config in self.configurations]
+        indexes = {name: i for i, name in enumerate(names)}
+        wins, ties = np.zeros((len(names), len(names))), np.zeros((len(names), len(names)))
+        for (first, second), result in self.results.items():
+            i, j = indexes[first], indexes[second]
+            wins[i, j] += result["first_wins"]
+            wins[j, i] += result["second_wins"]
+            ties[i, j] += result["ties"]
+            ties[j, i] += result["ties"]
+        return wins, ties
+
+    def get_standings(self):
+        wins, ties = self.get_score_matrices()
+        games = wins + wins.T + ties
+        ratings = get_elo_ratings(get_bradley_terry_strengths(wins + ties / 2, games))
+
+        # confidence intervals from resampling every pairing's outcomes
+        random_state = np.random.RandomState(self.seed)
+        samples = np.empty((self.bootstrap, len(ratings)))
+        upper = np.triu_indices(len(ratings), 1)
+        for b in range(self.bootstrap):
+            sample_wins = np.zeros(wins.shape)
+            sample_ties = np.zeros(ties.shape)
+            for i, j in zip(*upper):
+                if games[i, j] == 0:
+                    continue
+                counts = random_state.multinomial(int(games[i, j]), [wins[i, j] / games[i, j],
+                                                                     ties[i, j] / games[i, j],
+                                                                     wins[j, i] / games[i, j]])
+                sample_wins[i, j], sample_ties[i, j], sample_wins[j, i] = counts
+                sample_ties[j, i] = sample_ties[i, j]
+            samples[b] = get_elo_ratings(get_bradley_terry_strengths(sample_wins + sample_ties / 2, games))
+
+        standings = list()
+        for i, config in enumerate(self.configurations):
+            standings.append({
+                "name": config["name"],
+                "elo": float(ratings[i]),
+                "elo_low": float(np.percentile(samples[:, i], 2.5)) if self.bootstrap > 0 else None,
+                "elo_high": float(np.percentile(samples[:, i], 97.5)) if self.bootstrap > 0 else None,
+                "games": int(games[i].sum()),
+                "score": float((wins[i].sum() + ties[i].sum() / 2) / games[i].sum()) if games[i].sum() > 0 else
+                None
+            })
+        return sorted(standings, key=lambda x: x["elo"], reverse=True)
+
+    def _load_cache(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return dict()
+        with open(self.cache_path) as cache_file:
+            return json.load(cache_file)
+
+    def _save_cache(self, cache):
+        if self.cache_path is None:
+            return
+        with open(self.cache_path + ".tmp", "w") as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(self.cache_path + ".tmp", self.cache_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--configurations", dest="configurations",
+                        help="JSON file with a list of {name, type, kwargs} player configurations",
+                        required=False, default=None)
+    parser.add_argument("-p", "--player-types", dest="player_types", help="Player types with default parameters",
+                        nargs="+", choices=get_player_type_names(), required=False, default=list())
+    parser.add_argument("-g", "--games", dest="games", help="Games per pairing and seat order", type=int,
+                        required=False, default=100)
+    parser.add_argument("-s", "--size", dest="size", help="Board side length", type=int,
+                        required=False, default=None)
+    parser.add_argument("-k", "--attributes", dest="attributes", help="Number of binary token attributes", type=int,
+                        required=False, default=4)
+    parser.add_argument("-j", "--processes", dest="processes", help="Worker processes", type=int,
+                        required=False, default=None)
+    parser.add_argument("--cache", dest="cache", help="JSON file keeping the results of played pairings, they are "
+                        "reused as long as both configurations are the same, change one (say a version in its kwargs) "
+                        "once its player has been trained again",
+                        required=False, default=None)
+    parser.add_argument("--bootstrap", dest="bootstrap", help="Resamples for the rating confidence intervals",
+                        type=int, required=False, default=200)
+    args = parser.parse_args()
+    configurations = [{"name": player_type, "type": player_type} for player_type in args.player_types]
+    if args.configurations is not None:
+        with open(args.configurations) as configurations_file:
+            configurations.extend(json.load(configurations_file))
+    tournament = Tournament(configurations, games_per_pairing=args.games, size=args.size,
+                            num_attributes=args.attributes, processes=args.processes, cache_path=args.cache,
+                            bootstrap=args.bootstrap)
+    pprint.pprint(tournament.run())
@@ -0,0 +1,30 @@
+import unittest
+
+from game.core_elements import State
+from game.database_utils import get_best_value
+from game.quatro import get_binary_dimensions
+
+
+class TestBestValue(unittest.TestCase):
+
+    def setUp(self):
+        # 3x3 board, 2 of 4 tokens placed and one given: 7 cells times 1 token to hand over
+        self.state = State([(0, 0), (1, 1), "Given", None], get_binary_dimensions(2), 3)
+
+    def test_unlearned_actions_are_worth_the_default(self):
+        self.assertEqual(self.state.get_action_count(), 7)
+        item = {"action_mapping": {"2,0,2,3": -0.5, "2,0,1,3": -0.2}}
+        self.assertEqual(get_best_value(self.state, item), 0.0)
+        self.assertEqual(get_best_value(self.state, None), 0.0)
+
+    def test_every_action_learned(self):
+        item = {"action_mapping": {"2,{},{},3".format(*divmod(cell, 3)): -0.1 * cell for cell in range(2, 9)}}
+        self.assertAlmostEqual(get_best_value(self.state, item), -0.2)
+
+    def test_learned_action_above_the_default(self):
+        item = {"action_mapping": {"2,0,2,3": 0.7}}
+        self.assertEqual(get_best_value(self.state, item), 0.7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from game.complex_players import ReinforcedPlayer
+from game.frozen_policy import FrozenPolicy
+from game.quatro import QuartoGame, get_binary_dimensions
+from game.symmetry import get_canonical_key, iterate_symmetries
+
+
+class TestFrozenPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.random_state = random.Random(0)
+
+    def get_position(self, game, placed):
+        game.reset()
+        for i in range(placed):
+            token = self.random_state.choice(sorted(game.remaining_tokens, key=game.get_token_unique_id))
+            game.place_token(token, *self.random_state.choice(game.get_free_cells()))
+        given = self.random_state.choice(sorted(game.get_token_unique_id(t) for t in game.remaining_tokens))
+        return game.cell_token_ids, given
+
+    def test_symmetric_images_get_the_same_move(self):
+        size, num_attributes = 4, 4
+        game = QuartoGame(get_binary_dimensions(num_attributes), size=size)
+        cells, given = self.get_position(game, 3)
+        free_cell = cells.index(None)
+        returned_id = min(set(range(16)) - set(cells) - {given})
+        key, symmetry = get_canonical_key(cells, given, size, num_attributes)
+        policy = FrozenPolicy.from_moves({key: (symmetry.transform_cell(free_cell),
+                                                symmetry.transform_token(returned_id))})
+        self.assertEqual(policy.get_position_move(cells, given, size, num_attributes), (free_cell, returned_id))
+        for image in self.random_state.sample(list(iterate_symmetries(size, num_attributes)), 20):
+            image_cells, image_given = image.transform_position(cells, given)
+            self.assertEqual(policy.get_position_move(image_cells, image_given, size, num_attributes),
+                             (image.transform_cell(free_cell), image.transform_token(returned_id)))
+
+    def test_unknown_positions_get_a_legal_threat_aware_move(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "policy.npy")
+            FrozenPolicy.from_moves(dict()).save(path)
+            game = QuartoGame(get_binary_dimensions(3), size=3)
+            player = ReinforcedPlayer("frozen", game_instance=game, frozen_policy=path)
+            for i in range(50):
+                cells, given = self.get_position(game, self.random_state.randint(0, 5))
+                if game.winner:
+                    continue
+                winning_cells, _ = game.get_threat_analysis(game.tokens[given])
+                position = player.place_token(game.tokens[given])
+                self.assertIsNone(cells[position[0] * game.size + position[1]])
+                if len(winning_cells) > 0:
+                    self.assertIn(tuple(position), winning_cells)
+                    continue
+                game.place_token(game.tokens[given], *position)
+                _, safe_tokens = game.get_threat_analysis()
+                returned = player.choose_token(game.remaining_tokens)
+                if returned is not None:
+                    self.assertIn(returned, safe_tokens or game.remaining_tokens)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from game.game_records import GameRecordError, GameRecordWriter, iterate_game_records
+from game.quatro import QuartoGame, get_binary_dimensions
+
+
+def play_random_game(game, random_state):
+    game.reset()
+    moves = list()
+    while not game.winner and not game.tie:
+        token = random_state.choice(sorted(game.remaining_tokens, key=game.get_token_unique_id))
+        i, j = random_state.choice(game.get_free_cells())
+        game.place_token(token, i, j)
+        moves.append((i * game.size + j, game.get_token_unique_id(token)))
+    return moves, (len(moves) - 1) % 2 if game.winner else None
+
+
+class TestGameRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "games.bin")
+        self.random_state = random.Random(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_games(self, game, count):
+        games = [play_random_game(game, self.random_state) for i in range(count)]
+        with GameRecordWriter(self.path, game.size, len(game.dimensions)) as writer:
+            for moves, winner in games:
+                writer.write(["first", "second"], moves, winner)
+        return games
+
+    def test_round_trip(self):
+        for size, num_attributes in ((4, 4), (5, 5)):
+            game = QuartoGame(get_binary_dimensions(num_attributes), size=size)
+            games = self.write_games(game, 5)
+            records = list(iterate_game_records(self.path))
+            self.assertEqual([(record.moves, record.winner) for record in records], games)
+            for record in records:
+                for replayed in record.replay(game):
+                    pass
+                self.assertEqual(game.winner, record.winner is not None)
+            os.remove(self.path)
+
+    def test_appending_after_a_truncated_game(self):
+        game = QuartoGame(get_binary_dimensions(4))
+        games = self.write_games(game, 5)
+        os.truncate(self.path, os.path.getsize(self.path) - 3)
+        games = games[:4] + self.write_games(game, 1)
+        records = list(iterate_game_records(self.path))
+        self.assertEqual([(record.moves, record.winner) for record in records], games)
+        for record in records:
+            for replayed in record.replay(game):
+                pass
+
+    def test_names_fit_their_length_field(self):
+        with GameRecordWriter(self.path, 4, 4) as writer:
+            self.assertRaises(GameRecordError, writer.write, ["x" * 256, "second"], [(0, 0)], None)
+            writer.write(["x" * 255, "second"], [(0, 0)], None)
+        self.assertEqual(list(iterate_game_records(self.path))[0].player_names[0], "x" * 255)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from game.opening_book import OpeningBook, OpeningBookBuilder
+from game.symmetry import decode_position, iterate_symmetries
+
+
+class TestOpeningBook(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.book = OpeningBookBuilder(size=3, num_attributes=3, plies=2, depth=2).build()
+
+    def test_moves_are_legal_in_every_symmetric_image(self):
+        self.assertGreater(len(self.book.moves), 0)
+        for key in self.book.moves:
+            cells, given = decode_position(key)
+            for symmetry in iterate_symmetries(3, 3):
+                image_cells, image_given = symmetry.transform_position(cells, given)
+                cell, returned_id = self.book.get_move(image_cells, image_given)
+                self.assertIsNone(image_cells[cell])
+                if returned_id is not None:
+                    self.assertNotIn(returned_id, image_cells)
+                    self.assertNotEqual(returned_id, image_given)
+                self.assertEqual(self.book.get_value(image_cells, image_given), self.book.moves[key][2])
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "book.bin")
+            self.book.save(path)
+            loaded = OpeningBook.load(path)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(set(loaded.moves), set(self.book.moves))
+        for key, (cell, returned_id, value) in self.book.moves.items():
+            self.assertEqual(loaded.moves[key][:2], (cell, returned_id))
+            self.assertAlmostEqual(loaded.moves[key][2], value, delta=1 / 127)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+import random
+import unittest
+
+from game.core_elements import State
+from game.quatro import QuartoGame, QuartoToken, GameError, get_binary_dimensions, get_line_masks
+from game.symmetry import iterate_symmetries
+
+
+def place(game, token_ids, cells):
+    for token_id, (i, j) in zip(token_ids, cells):
+        game.place_token(game.tokens[token_id], i, j)
+
+
+class TestLineMasks(unittest.TestCase):
+
+    def test_rows_columns_and_diagonals(self):
+        for size in (3, 4, 5):
+            masks = get_line_masks(size)
+            self.assertEqual(len(masks), 2 * size + 2)
+            self.assertEqual(len(set(masks)), len(masks))
+            self.assertTrue(all(bin(mask).count("1") == size for mask in masks))
+            self.assertIn(sum(1 << i * size + i for i in range(size)), masks)
+            self.assertIn(sum(1 << i * size + size - 1 - i for i in range(size)), masks)
+
+
+class TestWins(unittest.TestCase):
+
+    def test_row_sharing_an_attribute_wins_on_a_larger_board(self):
+        # 32 tokens on 25 cells, every token of the row has the lowest bit set
+        game = QuartoGame(get_binary_dimensions(5), size=5)
+        place(game, [1, 3, 5, 7], [(2, 0), (2, 1), (2, 2), (2, 3)])
+        self.assertFalse(game.winner)
+        game.place_token(game.tokens[31], 2, 4)
+        self.assertTrue(game.winner)
+        self.assertTrue(game.completes_line(2, 4))
+        self.assertEqual(len(game.completed), 1)
+
+    def test_column_sharing_a_missing_attribute_wins(self):
+        # 8 tokens on 16 cells, none of the column's tokens has the highest bit
+        game = QuartoGame(get_binary_dimensions(3), size=4)
+        place(game, [0, 1, 2, 3], [(0, 1), (1, 1), (2, 1), (3, 1)])
+        self.assertTrue(game.winner)
+
+    def test_diagonal_without_a_shared_attribute_does_not_win(self):
+        game = QuartoGame(get_binary_dimensions(4), size=3)
+        place(game, [0, 15, 1], [(0, 0), (1, 1), (2, 2)])
+        self.assertFalse(game.winner)
+        self.assertFalse(game.completes_line(2, 2))
+
+    def test_anti_diagonal_wins(self):
+        game = QuartoGame(get_binary_dimensions(4), size=3)
+        place(game, [8, 9, 10], [(0, 2), (1, 1), (2, 0)])
+        self.assertTrue(game.winner)
+
+    def test_removing_a_token_undoes_the_win(self):
+        game = QuartoGame(get_binary_dimensions(4), size=3)
+        place(game, [8, 9, 10], [(0, 0), (0, 1), (0, 2)])
+        self.assertTrue(game.winner)
+        game.remove_token(0, 2)
+        self.assertFalse(game.winner)
+        self.assertIn(game.tokens[10], game.remaining_tokens)
+
+    def test_illegal_placements(self):
+        game = QuartoGame(get_binary_dimensions(4))
+        game.place_token(game.tokens[0], 0, 0)
+        self.assertRaises(GameError, game.place_token, game.tokens[0], 1, 1)
+        self.assertRaises(GameError, game.place_token, game.tokens[1], 0, 0)
+        self.assertRaises(GameError, game.place_token, game.tokens[1], 4, 0)
+
+    def test_only_binary_attributes(self):
+        self.assertRaises(GameError, QuartoGame, [{0, 1, 2}, {0, 1}])
+
+
+class TestTokens(unittest.TestCase):
+
+    def test_tokens_built_before_any_game(self):
+        dimensions = [{"tall", "short"}, {"dark", "light"}, {"round", "square"}, {"hollow", "solid"}]
+        token = QuartoToken(("short", "dark", "square", "hollow"))
+        other = QuartoToken(("tall", "dark", "round", "hollow"))
+        self.assertEqual(token.get_similarities(other), [None, "dark", None, "hollow"])
+        game = QuartoGame(dimensions)
+        self.assertIn(token, game.remaining_tokens)
+        self.assertEqual(token.get_similarities(other), [None, "dark", None, "hollow"])
+        game.place_token(token, 0, 0)
+        self.assertEqual(game.cell_token_ids[0], game.get_token_unique_id(token))
+
+    def test_values_shared_by_other_dimensions(self):
+        QuartoGame([{1, 2}, {0, 1}, {0, 1}])
+        game = QuartoGame(get_binary_dimensions(3))
+        similarities = game.tokens[3].get_similarities([game.tokens[1], game.tokens[7]])
+        self.assertEqual(similarities, [None, None, 1])
+        place(game, [3, 1, 7], [(0, 0), (0, 1), (0, 2)])
+        self.assertTrue(game.winner)
+
+
+class TestTie(unittest.TestCase):
+
+    def test_full_board_without_a_line_is_a_tie(self):
+        game = QuartoGame(get_binary_dimensions(4), size=3)
+        place(game, [13, 3, 14, 6, 8, 9, 1, 12, 2], [divmod(cell, 3) for cell in range(9)])
+        self.assertFalse(game.winner)
+        self.assertTrue(game.tie)
+
+    def test_running_out_of_tokens_is_a_tie(self):
+        # 4 tokens on 16 cells
+        game = QuartoGame(get_binary_dimensions(2), size=4)
+        place(game, [0, 3, 1, 2], [(0, 0), (1, 2), (2, 1), (3, 3)])
+        self.assertFalse(game.winner)
+        self.assertTrue(game.tie)
+
+    def test_empty_board_is_not_a_tie(self):
+        self.assertFalse(QuartoGame(get_binary_dimensions(4)).tie)
+
+
+class TestState(unittest.TestCase):
+
+    def test_state_round_trip(self):
+        random_state = random.Random(0)
+        for size, num_attributes in ((4, 4), (5, 5), (4, 3), (3, 4)):
+            game = QuartoGame(get_binary_dimensions(num_attributes), size=size)
+            for i in range(random_state.randint(1, min(size * size, 1 << num_attributes))):
+                token = random_state.choice(sorted(game.remaining_tokens, key=game.get_token_unique_id))
+                game.place_token(token, *random_state.choice(game.get_free_cells()))
+            copy = QuartoGame(get_binary_dimensions(num_attributes), size=size)
+            copy.state = game.state
+            self.assertEqual(copy.cell_token_ids, game.cell_token_ids)
+            self.assertEqual(copy.bitboards, game.bitboards)
+            self.assertEqual(copy.remaining_tokens, game.remaining_tokens)
+            self.assertEqual(copy.winner, game.winner)
+
+    def test_packed_key_round_trip(self):
+        dimensions = get_binary_dimensions(5)
+        game = QuartoGame(dimensions, size=5)
+        place(game, [0, 31, 7], [(0, 0), (4, 4), (2, 3)])
+        state = State(game.state, dimensions, 5)
+        state.set_token_as_given(12)
+        self.assertEqual(State.from_key(state.key, dimensions, 5).encode(), state.encode())
+
+    def test_rotations_keep_tokens_on_the_board(self):
+        # more tokens than cells, rotations move the placed tokens and leave the rest alone
+        dimensions = get_binary_dimensions(5)
+        game = QuartoGame(dimensions, size=5)
+        place(game, [30, 2], [(0, 1), (4, 4)])
+        state = State(game.state, dimensions, 5)
+        state.set_token_as_given(5)
+        positions = list()
+        for transform in state.iterate_transformations():
+            transformed = transform.transform_state(state)
+            placed = [transformed.get_token_id_status(token_id) for token_id in transformed.get_token_ids()
+                      if transformed.is_token_placed(token_id)]
+            self.assertEqual(len(placed), 2)
+            self.assertTrue(all(0 <= i < 5 and 0 <= j < 5 for i, j in placed))
+            positions.append(tuple(sorted(placed)))
+        self.assertEqual(len(set(positions)), 4)
+
+
+class TestThreatAnalysis(unittest.TestCase):
+
+    def get_winning_cells(self, game, token):
+        winning_cells = set()
+        for i, j in game.get_free_cells():
+            game.place_token(token, i, j)
+            if game.winner:
+                winning_cells.add((i, j))
+            game.remove_token(i, j)
+        return winning_cells
+
+    def test_matches_trying_every_placement(self):
+        random_state = random.Random(0)
+        for size, num_attributes in ((4, 4), (3, 3), (5, 5)):
+            game = QuartoGame(get_binary_dimensions(num_attributes), size=size)
+            checked, threatened = 0, 0
+            while checked < 50:
+                game.reset()
+                for i in range(random_state.randint(0, min(size * size, 1 << num_attributes) - 1)):
+                    token = random_state.choice(sorted(game.remaining_tokens, key=game.get_token_unique_id))
+                    game.place_token(token, *random_state.choice(game.get_free_cells()))
+                    if game.winner:
+                        break
+                if game.winner or len(game.remaining_tokens) == 0:
+                    continue
+                token = random_state.choice(sorted(game.remaining_tokens, key=game.get_token_unique_id))
+                winning_cells, safe_tokens = game.get_threat_analysis(token)
+                self.assertEqual(winning_cells, self.get_winning_cells(game, token))
+                self.assertEqual(safe_tokens, {other for other in list(game.remaining_tokens)
+                                               if other != token and len(self.get_winning_cells(game, other)) == 0})
+                checked += 1
+                threatened += len(winning_cells) > 0
+            # not only quiet positions, where both are trivially right
+            self.assertGreater(threatened, 0)
+
+
+class TestZobrist(unittest.TestCase):
+
+    def setUp(self):
+        self.random_state = random.Random(0)
+
+    def get_game(self, size, num_attributes, cells):
+        game = QuartoGame(get_binary_dimensions(num_attributes), size=size)
+        for cell, token_id in enumerate(cells):
+            if token_id is not None:
+                game.place_token(game.tokens[token_id], *divmod(cell, size))
+        return game
+
+    def test_symmetric_images_share_the_canonical_hash(self):
+        for size, num_attributes in ((4, 4), (3, 3), (5, 3)):
+            game = QuartoGame(get_binary_dimensions(num_attributes), size=size)
+            for i in range(4):
+                token = self.random_state.choice(sorted(game.remaining_tokens, key=game.get_token_unique_id))
+                game.place_token(token, *self.random_state.choice(game.get_free_cells()))
+            given = min(game.get_token_unique_id(t) for t in game.remaining_tokens)
+            canonical_hash = game.get_zobrist_hash(given, canonical=True)
+            for symmetry in iterate_symmetries(size, num_attributes):
+                cells, image_given = symmetry.transform_position(game.cell_token_ids, given)
+                image = self.get_game(size, num_attributes, cells)
+                self.assertEqual(image.get_zobrist_hash(image_given, canonical=True), canonical_hash)
+
+    def test_incremental_hashes_match_a_fresh_game(self):
+        for size, num_attributes in ((4, 4), (5, 5)):
+            game = QuartoGame(get_binary_dimensions(num_attributes), size=size)
+            game.get_zobrist_hash(canonical=True)
+            for step in range(60):
+                placed = [divmod(cell, size) for cell, token_id in enumerate(game.cell_token_ids)
+                          if token_id is not None]
+                if len(placed) > 0 and (len(game.get_free_cells()) == 0 or self.random_state.random() < 0.3):
+                    game.remove_token(*self.random_state.choice(placed))
+                else:
+                    token = self.random_state.choice(sorted(game.remaining_tokens, key=game.get_token_unique_id))
+                    game.place_token(token, *self.random_state.choice(game.get_free_cells()))
+                fresh = self.get_game(size, num_attributes, game.cell_token_ids)
+                for given in (None, min((game.get_token_unique_id(t) for t in game.remaining_tokens), default=None)):
+                    self.assertEqual(game.get_zobrist_hash(given), fresh.get_zobrist_hash(given))
+                    self.assertEqual(game.get_zobrist_hash(given, canonical=True),
+                                     fresh.get_zobrist_hash(given, canonical=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from game.core_elements import State, Action
+from game.quatro import get_binary_dimensions
+from game.replay_buffer import ReplayBuffer, ReplayBufferError
+
+
+class TestReplayBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "buffer.bin")
+        self.dimensions = get_binary_dimensions(3)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_transition(self, token_id):
+        state = State([None for i in range(8)], self.dimensions, 3)
+        state.set_token_as_given(token_id)
+        next_state = State([None for i in range(8)], self.dimensions, 3)
+        next_state.set_token_position(token_id, (1, 2))
+        next_state.set_token_as_given(7 - token_id)
+        return state, Action(token=token_id, position=(1, 2), returned_token=7 - token_id), next_state
+
+    def test_reopened_buffer_keeps_its_cursor(self):
+        replay_buffer = ReplayBuffer(4, self.dimensions, size=3, path=self.path)
+        replay_buffer.extend([self.get_transition(token_id) for token_id in range(6)], 1.0)
+        replay_buffer.flush()
+        del replay_buffer
+        reopened = ReplayBuffer(4, self.dimensions, size=3, path=self.path)
+        self.assertEqual(len(reopened), 4)
+        # the ring wrapped around, the next transition overwrites the third one
+        reopened.append(*self.get_transition(0), 0.0, 1)
+        self.assertEqual(reopened.decode_action(reopened._transitions[2]["action"]).token, 0)
+        self.assertEqual(reopened.decode_state(reopened._transitions[1]["next_state"]).encode(),
+                         self.get_transition(5)[2].encode())
+
+    def test_other_variant_is_refused(self):
+        ReplayBuffer(4, self.dimensions, size=3, path=self.path).flush()
+        with self.assertRaises(ReplayBufferError):
+            ReplayBuffer(8, self.dimensions, size=3, path=self.path)
+        with open(self.path, "r+b") as buffer_file:
+            buffer_file.truncate(10)
+        with self.assertRaises(ReplayBufferError):
+            ReplayBuffer(4, self.dimensions, size=3, path=self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
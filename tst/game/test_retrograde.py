@@ -0,0 +1,89 @@
+import glob
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from game.quatro import QuartoGame, get_binary_dimensions
+from game.retrograde import RetrogradeSolver, RetrogradeValues, merge_runs, read_binary, to_key_array, _key_dtype
+from game.search import NegamaxSearch
+
+
+class TestMergeRuns(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_matches_sorting_everything(self):
+        random_state = random.Random(0)
+        # keys on both sides of the 64 bit split, with duplicates within and across runs
+        pool = [random_state.getrandbits(70) for i in range(300)] + list(range(20))
+        runs = [to_key_array(sorted(set(random_state.choice(pool) for i in range(random_state.randint(0, 200)))))
+                for run in range(5)]
+        path = os.path.join(self.directory, "merged.bin")
+        for chunk_size in [1, 7, 1000]:
+            written = merge_runs(runs, path, chunk_size)
+            expected = np.unique(np.concatenate(runs))
+            self.assertEqual(written, len(expected))
+            self.assertEqual(read_binary(path, _key_dtype).tolist(), expected.tolist())
+
+
+class TestRetrogradeSolver(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def solve(self):
+        # shards and chunks far smaller than the layers, every one of them is split
+        for description in RetrogradeSolver(self.directory, size=3, num_attributes=2, processes=1, shard_size=5,
+                                             chunk_size=3).run():
+            pass
+        return RetrogradeValues(self.directory)
+
+    def get_positions(self):
+        random_state = random.Random(0)
+        game = QuartoGame(get_binary_dimensions(2), size=3)
+        positions = list()
+        while len(positions) < 40:
+            game.reset()
+            for i in range(random_state.randint(0, 2)):
+                token = random_state.choice(sorted(game.remaining_tokens, key=game.get_token_unique_id))
+                game.place_token(token, *random_state.choice(game.get_free_cells()))
+            if game.winner:
+                continue
+            given = random_state.choice(sorted(game.get_token_unique_id(t) for t in game.remaining_tokens))
+            positions.append((game.cell_token_ids, given))
+        return positions
+
+    def test_values_match_a_full_search(self):
+        values = self.solve()
+        game = QuartoGame(get_binary_dimensions(2), size=3)
+        for cells, given in self.get_positions():
+            game.reset()
+            for cell in range(len(cells)):
+                if cells[cell] is not None:
+                    game.place_token(game.tokens[cells[cell]], *divmod(cell, 3))
+            self.assertEqual(values.get_value(cells, given), NegamaxSearch(game, depth=9).get_best_move(given)[0])
+
+    def test_resumes_where_it_stopped(self):
+        positions = self.get_positions()
+        expected = [self.solve().get_value(cells, given) for cells, given in positions]
+        # as if stopped while expanding layer 2, before any layer was solved
+        shutil.rmtree(os.path.join(self.directory, "layer-02"))
+        for path in glob.glob(os.path.join(self.directory, "layer-*", "values-*.bin")):
+            os.remove(path)
+        values = self.solve()
+        self.assertEqual([values.get_value(cells, given) for cells, given in positions], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()